@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# Benchmarks doublewrap against a local stand-in for the remote host.
+#
+# A fake ssh (fakessh.py) is put first on PATH so every remote command and
+# duplicity's rsync transport run locally while being counted. For every
+# scenario a synthetic tree is backed up --versions times and the usual
+# operations are timed. One json record per operation is printed with the
+# processes doublewrap started (subprocesses, duplicity_runs), the commands
+# it logged through runAndLog and the ssh round trips, e.g.
+#
+#   python bench/bench.py --files 100 1000 --size 4096 --versions 5 --output bench_output.txt
+from __future__ import print_function
+from __future__ import unicode_literals
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess as sp
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import doublewrap  # noqa: E402
+
+CFG_CONTENT = '''
+[PATHS]
+{src}
+[DESTINATION]
+Host = localhost
+backup_root = backups
+[AUTH]
+keyid = {keyid}
+[CACHE]
+dir = {cache}
+'''
+
+# one argument, duplicity >= 2.0 rejects an option value that looks like an option
+BACKUP_ARGS = ('--gpg-options=--trust-model=always',)
+
+
+def setupEnvironment(root):
+    bin_dir = os.path.join(root, 'bin')
+    os.mkdir(bin_dir)
+    fakessh = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fakessh.py')
+    with open(os.path.join(bin_dir, 'ssh'), 'w') as f:
+        f.write('#!/bin/sh\nexec {} {} "$@"\n'.format(sys.executable, fakessh))
+    os.chmod(os.path.join(bin_dir, 'ssh'), 0o755)
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+    os.environ['DOUBLEWRAP_FAKE_REMOTE'] = os.path.join(root, 'remote')
+    os.environ['DOUBLEWRAP_BENCH_LOG'] = os.path.join(root, 'remote.log')
+    os.environ['XDG_CACHE_HOME'] = os.path.join(root, 'cache')
+    os.environ['XDG_DATA_HOME'] = os.path.join(root, 'data')
+    os.environ['GNUPGHOME'] = os.path.join(root, 'gnupg')
+    os.mkdir(os.environ['GNUPGHOME'], 0o700)
+    sp.check_call(['gpg', '--batch', '--quiet', '--pinentry-mode', 'loopback', '--passphrase', '', '--quick-gen-key',
+                   'doublewrap bench', 'rsa2048', 'default', 'never'])
+    out = sp.check_output(['gpg', '--batch', '--list-keys', '--with-colons']).decode()
+    return [l.split(':')[9] for l in out.splitlines() if l.startswith('fpr')][0]
+
+
+def makeTree(src, files, size):
+    for i in range(files):
+        dir_ = os.path.join(src, 'dir{}'.format(i % 10))
+        if not os.path.exists(dir_):
+            os.makedirs(dir_)
+        with open(os.path.join(dir_, 'file{}'.format(i)), 'wb') as f:
+            f.write(os.urandom(size))
+
+
+def changeTree(src, files, size, change):
+    changed = set(random.sample(range(files), max(1, int(files * change))))
+    # the first file changes every version so gitrestore has a history to rebuild
+    changed.add(0)
+    for i in changed:
+        with open(os.path.join(src, 'dir{}'.format(i % 10), 'file{}'.format(i)), 'ab') as f:
+            f.write(os.urandom(max(1, size // 10)))
+
+
+def readLog():
+    if not os.path.exists(os.environ['DOUBLEWRAP_BENCH_LOG']):
+        return []
+    with open(os.environ['DOUBLEWRAP_BENCH_LOG']) as f:
+        return [json.loads(l) for l in f]
+
+
+def measure(dw, operation, func, *args):
+    # every process doublewrap starts goes through subprocess.Popen, duplicity, ssh and git alike
+    spawned = []
+    popen = sp.Popen
+
+    def countingPopen(*popenargs, **kwargs):
+        spawned.append(popenargs[0] if len(popenargs) > 0 else kwargs['args'])
+        return popen(*popenargs, **kwargs)
+
+    commands = len(dw.command_timings)
+    remote = len(readLog())
+    sp.Popen = countingPopen
+    try:
+        start = time.time()
+        out = func(*args)
+        if out is not None and not isinstance(out, (list, dict)):
+            out = list(out)
+        wall = time.time() - start
+    finally:
+        sp.Popen = popen
+    trips = readLog()[remote:]
+    return {'operation': operation, 'wall': wall,
+            'subprocesses': len(spawned),
+            'duplicity_runs': len([cmd for cmd in spawned if os.path.basename(cmd[0]) == 'duplicity']),
+            'logged_commands': len(dw.command_timings) - commands,
+            'remote_round_trips': len(trips),
+            'bytes': sum(t['bytes_in'] + t['bytes_out'] for t in trips)}
+
+
+def runScenario(root, keyid, files, size, versions, change):
+    scenario = os.path.join(root, 'scenario-{}-{}-{}'.format(files, size, versions))
+    src = os.path.join(scenario, 'src')
+    os.makedirs(src)
+    shutil.rmtree(os.environ['DOUBLEWRAP_FAKE_REMOTE'], ignore_errors=True)
+    os.mkdir(os.environ['DOUBLEWRAP_FAKE_REMOTE'])
+    makeTree(src, files, size)
+    cfg_name = os.path.join(scenario, 'bench.cfg')
+    with open(cfg_name, 'w') as cfg:
+        cfg.write(CFG_CONTENT.format(src=src, keyid=keyid, cache=os.path.join(scenario, 'cache')))
+
+    first = os.path.join(src, 'dir0', 'file0')[1:]
+    records = []
+    with doublewrap.DuplicityWrapper(cfg_name) as dw:
+        for version in range(versions):
+            if version > 0:
+                changeTree(src, files, size, change)
+            records.append(measure(dw, 'backup', dw.backup, *BACKUP_ARGS))
+        records.append(measure(dw, 'status', dw.status, False))
+        records.append(measure(dw, 'status_cached', dw.status, False))
+        records.append(measure(dw, 'list', dw.listfiles))
+        records.append(measure(dw, 'list_prefix', dw.listfiles, None, os.path.dirname(first)))
+        records.append(measure(dw, 'restore', dw.restore, os.path.join(scenario, 'restored'), first))
+        records.append(measure(dw, 'gitrestore', dw.restoreGit, os.path.join(scenario, 'git'), first, 'file0'))
+        records.append(measure(dw, 'gitrestore_jobs', dw.restoreGit, os.path.join(scenario, 'git_jobs'), first,
+                               'file0', 4))
+        records.append(measure(dw, 'verify', dw.verify))
+    for record in records:
+        record.update({'files': files, 'size': size, 'versions': versions, 'change': change})
+    return records
+
+
+def versionInfo():
+    info = {'python': sys.version.split()[0]}
+    info['duplicity'] = sp.check_output(['duplicity', '--version']).decode().strip()
+    try:
+        info['doublewrap'] = sp.check_output(['git', 'rev-parse', 'HEAD'], stderr=sp.STDOUT,
+                                             cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except sp.CalledProcessError:
+        info['doublewrap'] = None
+    return info
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark doublewrap against a local fake remote')
+    parser.add_argument('--files', nargs='+', type=int, default=[100, 1000], help='number of files per tree')
+    parser.add_argument('--size', type=int, default=4096, help='size of each file in bytes')
+    parser.add_argument('--versions', type=int, default=5, help='number of backups, the first one is full')
+    parser.add_argument('--change', type=float, default=0.1, help='fraction of files changed between backups')
+    parser.add_argument('--output', help='also write all records to this file as json')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='doublewrap-bench-')
+    try:
+        info = versionInfo()
+        keyid = setupEnvironment(root)
+        records = []
+        for files in args.files:
+            for record in runScenario(root, keyid, files, args.size, args.versions, args.change):
+                record.update(info)
+                print(json.dumps(record))
+                records.append(record)
+        if args.output is not None:
+            with open(args.output, 'w') as f:
+                json.dump(records, f, indent=2)
+    finally:
+        if args.keep:
+            print('scratch directory kept at {}'.format(root), file=sys.stderr)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
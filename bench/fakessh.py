@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# Stand-in for ssh used by bench.py. The remote command is run locally in
+# $DOUBLEWRAP_FAKE_REMOTE and every invocation is appended as a json line to
+# $DOUBLEWRAP_BENCH_LOG with the bytes that went each way.
+from __future__ import print_function
+import json
+import os
+import subprocess as sp
+import sys
+import threading
+import time
+
+# ssh options that take a value
+VALUE_OPTIONS = 'BbcDEeFIiJLlmOoPpQRSWw'
+
+
+def parseArgs(argv):
+    control = None
+    i = 0
+    while i < len(argv) and argv[i].startswith('-'):
+        arg = argv[i]
+        i += 1
+        for j, letter in enumerate(arg[1:]):
+            if letter in VALUE_OPTIONS:
+                value = arg[j + 2:]
+                if value == '':
+                    value = argv[i]
+                    i += 1
+                if letter == 'O':
+                    control = value
+                break
+    return control, ' '.join(argv[i + 1:])
+
+
+def pump(src, dst, counts, key):
+    try:
+        while True:
+            chunk = os.read(src.fileno(), 2 ** 16)
+            if len(chunk) == 0:
+                break
+            counts[key] += len(chunk)
+            dst.write(chunk)
+            dst.flush()
+    except (IOError, OSError):
+        pass
+    finally:
+        try:
+            dst.close()
+        except (IOError, OSError):
+            pass
+
+
+def main():
+    control, command = parseArgs(sys.argv[1:])
+    if control is not None:
+        # -O exit and friends talk to a master connection, there is none
+        return 0
+    start = time.time()
+    counts = {'in': 0, 'out': 0}
+    p = sp.Popen(['sh', '-c', command], stdin=sp.PIPE, stdout=sp.PIPE,
+                 cwd=os.environ.get('DOUBLEWRAP_FAKE_REMOTE', os.path.expanduser('~')))
+    stdin = threading.Thread(target=pump, args=(getattr(sys.stdin, 'buffer', sys.stdin), p.stdin, counts, 'in'))
+    stdin.daemon = True
+    stdin.start()
+    pump(p.stdout, getattr(sys.stdout, 'buffer', sys.stdout), counts, 'out')
+    returncode = p.wait()
+    if 'DOUBLEWRAP_BENCH_LOG' in os.environ:
+        with open(os.environ['DOUBLEWRAP_BENCH_LOG'], 'a') as log:
+            log.write(json.dumps({'command': command, 'bytes_in': counts['in'], 'bytes_out': counts['out'],
+                                  'elapsed': time.time() - start, 'returncode': returncode}) + '\n')
+    return returncode
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# Times how long the doublewrap cli takes to start and answer without the remote.
+#
+# Every case is run --repeat times in a fresh interpreter and one json record
+# with the fastest and median wall time is printed per case, for this tree and
+# for the top level modules as of --baseline (the first commit by default), e.g.
+#
+#   python bench/startup.py --repeat 20 --baseline HEAD~5
+#
+# Bytecode is cached as in a normal checkout, python compiles the script it
+# runs on every start but not the modules that script imports.
+from __future__ import print_function
+from __future__ import unicode_literals
+import argparse
+import json
+import os
+import shutil
+import subprocess as sp
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import doublewrap  # noqa: E402
+
+CFG_CONTENT = '''
+[PATHS]
+{src}
+[DESTINATION]
+Host = localhost
+backup_root = backups
+[AUTH]
+keyid = 00000000
+[CACHE]
+dir = {cache}
+'''
+
+STATUS_OUTPUT = '''Last full backup date: Tue Jun 17 10:00:00 2014
+Collection Status
+-----------------
+Found 0 secondary backup chains.
+
+Found primary backup chain with matching signature chain:
+-------------------------
+Chain start time: Tue Jun 17 10:00:00 2014
+Chain end time: Tue Jun 17 10:00:00 2014
+Number of contained backup sets: 1
+Total number of contained volumes: 1
+ Type of backup set:                            Time:      Num volumes:
+                Full         Tue Jun 17 10:00:00 2014                 1
+-------------------------
+No orphaned or incomplete backup sets found.
+'''
+
+
+def seedCache(root):
+    # the cached status an earlier online run would have left behind
+    src = os.path.join(root, 'src')
+    os.mkdir(src)
+    cfg_name = os.path.join(root, 'bench.cfg')
+    with open(cfg_name, 'w') as cfg:
+        cfg.write(CFG_CONTENT.format(src=src, cache=os.path.join(root, 'cache')))
+    with doublewrap.DuplicityWrapper(cfg_name) as dw:
+        path = os.path.join(dw.cache_dir, 'runs', 'status')
+        doublewrap._makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(STATUS_OUTPUT)
+        dw._setLatest(dw._statusCmd(), path)
+    return cfg_name
+
+
+def timeCase(cmd, repeat, cwd):
+    # bytecode may be cached like it is in a normal installation, the first run writes it
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    walls = []
+    with open(os.devnull, 'w') as null:
+        sp.check_call(cmd, stdout=null, cwd=cwd, env=env)
+        for _ in range(repeat):
+            start = time.time()
+            sp.check_call(cmd, stdout=null, cwd=cwd, env=env)
+            walls.append(time.time() - start)
+    walls.sort()
+    return {'min': walls[0], 'median': walls[len(walls) // 2]}
+
+
+def baselineTree(root, rev):
+    tree = os.path.join(root, 'baseline')
+    os.mkdir(tree)
+    names = sp.check_output(['git', 'ls-tree', '--name-only', rev], cwd=ROOT).decode().split()
+    for name in names:
+        if name.endswith('.py'):
+            with open(os.path.join(tree, name), 'wb') as f:
+                f.write(sp.check_output(['git', 'show', '{}:{}'.format(rev, name)], cwd=ROOT))
+    return tree
+
+
+def firstCommit():
+    return sp.check_output(['git', 'rev-list', '--max-parents=0', 'HEAD'], cwd=ROOT).decode().split()[0]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark doublewrap cli startup')
+    parser.add_argument('--repeat', type=int, default=10, help='runs per case')
+    parser.add_argument('--baseline', help='git revision to compare with, defaults to the first commit')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='doublewrap-startup-')
+    try:
+        cfg_name = seedCache(root)
+        baseline = args.baseline if args.baseline is not None else firstCommit()
+        trees = [('current', ROOT), (baseline, baselineTree(root, baseline))]
+        for version, tree in trees:
+            cases = [('python', [sys.executable, '-c', 'pass']),
+                     ('import', [sys.executable, '-c', 'import doublewrap']),
+                     ('help', [sys.executable, 'doublewrap.py', '--help'])]
+            if version == 'current':
+                cases.append(('status_offline', [sys.executable, 'doublewrap.py', '-c', cfg_name, '--offline',
+                                                 'status']))
+            for name, cmd in cases:
+                record = timeCase(cmd, args.repeat, tree)
+                record.update({'case': name, 'version': version, 'repeat': args.repeat,
+                               'python': sys.version.split()[0]})
+                print(json.dumps(record))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
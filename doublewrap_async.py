@@ -0,0 +1,185 @@
+import asyncio
+import collections
+import os
+import shutil
+import subprocess as sp
+
+from doublewrap import DuplicityWrapper, _Command, _parseStatus, _groupChains, _parseBackupStats
+
+
+class AsyncDuplicityWrapper(object):
+    # config parsing and command construction are shared with DuplicityWrapper,
+    # only the process handling differs
+
+    def __init__(self, cfg_file, verbosity=0):
+        self.wrapper = DuplicityWrapper(cfg_file, verbosity=verbosity)
+        self.logger = self.wrapper.logger
+
+    @classmethod
+    def _fromWrapper(cls, wrapper):
+        async_wrapper = cls.__new__(cls)
+        async_wrapper.wrapper = wrapper
+        async_wrapper.logger = wrapper.logger
+        return async_wrapper
+
+    def _pathWrappers(self):
+        return [self._fromWrapper(w) for w in self.wrapper.pathWrappers()]
+
+    async def close(self):
+        w = self.wrapper
+        if w.control_dir is None:
+            return
+        if os.path.exists(os.path.join(w.control_dir, 'control')):
+            await self._output(w._exitCmd(), check=False)
+        shutil.rmtree(w.control_dir, ignore_errors=True)
+        w.control_dir = None
+        w.control_path = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _output(self, cmd, check=True):
+        self.logger.info('executing {}'.format(' '.join(cmd)))
+        p = await asyncio.create_subprocess_exec(*cmd, stdout=sp.PIPE)
+        try:
+            out, _ = await p.communicate()
+        finally:
+            if p.returncode is None:
+                p.kill()
+                await p.wait()
+        if check and p.returncode != 0:
+            raise sp.CalledProcessError(p.returncode, cmd, output=out)
+        return out
+
+    async def _drainStderr(self, p, stderr_tail):
+        async for l in p.stderr:
+            l_str = l.rstrip().decode('utf-8', 'replace')
+            self.logger.info(l_str)
+            stderr_tail.append(l_str)
+
+    async def runAndLog(self, cmd):
+        # async generator of stdout lines, the process is killed if the caller stops early or is cancelled
+        self.wrapper._connect()
+        self.logger.info('Running command {}'.format(' '.join(cmd)))
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        p = await asyncio.create_subprocess_exec(*cmd, stdout=sp.PIPE, stderr=sp.PIPE, limit=2 ** 20)
+        stderr_tail = collections.deque(maxlen=_Command.stderr_tail_lines)
+        drain = asyncio.ensure_future(self._drainStderr(p, stderr_tail))
+        complete = False
+        try:
+            async for l in p.stdout:
+                l_str = l.strip().decode()
+                self.logger.info(l_str)
+                yield l_str
+            complete = True
+        finally:
+            if not complete and p.returncode is None:
+                p.kill()
+            await drain
+            returncode = await p.wait()
+            elapsed = loop.time() - start
+            self.wrapper._commandFinished(cmd, elapsed, returncode)
+            self.logger.info('{} exited with {} after {:.2f}s'.format(cmd[0], returncode, elapsed))
+        if returncode != 0:
+            raise sp.CalledProcessError(returncode, cmd, output='\n'.join(stderr_tail))
+
+    async def _run(self, cmd, timeout=None):
+        async def consume():
+            async for _ in self.runAndLog(cmd):
+                pass
+        await asyncio.wait_for(consume(), timeout)
+
+    async def probeRemote(self):
+        w = self.wrapper
+        if w.remote_listing is None:
+            w._connect()
+            w._setRemoteListing((await self._output(w._probeCmd())).decode())
+        return w.remote_listing
+
+    async def backup(self, *args, timeout=None):
+        w = self.wrapper
+        if w.split_paths:
+            return await self._backupPaths(args, timeout)
+        remote_ls = await self.probeRemote()
+        chains = []
+        if w._containsSigs(remote_ls) and w._rotationPolicy():
+            chains = await self.backupChains(timeout)
+        incremental = not w._needsFull(remote_ls, chains)
+        backup_cmd = w._backupCmd(incremental, args)
+
+        async def collect():
+            return [l async for l in self.runAndLog(backup_cmd)]
+        try:
+            stats = _parseBackupStats(await asyncio.wait_for(collect(), timeout))
+        finally:
+            w.remote_listing = None
+        backup_stats = w._recordBackup('incr' if incremental else 'full', stats)
+        if 'keep_full' in w.policy:
+            await self._run(w._cleanupCmd(), timeout)
+        return backup_stats
+
+    async def _backupPaths(self, args, timeout):
+        semaphore = asyncio.Semaphore(max(1, self.wrapper.jobs))
+        loop = asyncio.get_event_loop()
+
+        async def backupOne(async_wrapper):
+            async with semaphore:
+                start = loop.time()
+                stats = None
+                try:
+                    stats = await async_wrapper.backup(*args, timeout=timeout)
+                    error = None
+                except (RuntimeError, sp.CalledProcessError, asyncio.TimeoutError) as e:
+                    error = e
+                return async_wrapper.wrapper.srcs[0], error, loop.time() - start, stats
+
+        results = await asyncio.gather(*[backupOne(w) for w in self._pathWrappers()])
+        return self.wrapper._pathResults(results)
+
+    async def restore(self, target, file_=None, time_=None, timeout=None):
+        w = self.wrapper
+        if w.split_paths:
+            if file_ is None:
+                raise RuntimeError('split_paths is set, a file to restore is required')
+            w = w._wrapperFor(file_)
+        await self._run(w._restoreCmd(target, file_, time_), timeout)
+
+    async def listfiles(self, time_=None):
+        if self.wrapper.split_paths:
+            for async_wrapper in self._pathWrappers():
+                async for l in async_wrapper.listfiles(time_):
+                    yield l
+            return
+        async for l in self.runAndLog(self.wrapper._listCmd(time_)):
+            yield l
+
+    async def status(self, timeout=None):
+        if self.wrapper.split_paths:
+            out = []
+            for async_wrapper in self._pathWrappers():
+                out.append('{}:'.format(async_wrapper.wrapper.srcs[0]))
+                out.extend(await async_wrapper.status(timeout))
+            return out
+
+        async def collect():
+            return [l async for l in self.runAndLog(self.wrapper._statusCmd())]
+        return await asyncio.wait_for(collect(), timeout)
+
+    async def backupChains(self, timeout=None):
+        if self.wrapper.split_paths:
+            chains = {}
+            for async_wrapper in self._pathWrappers():
+                chains[async_wrapper.wrapper.srcs[0]] = await async_wrapper.backupChains(timeout)
+            return chains
+        return _groupChains(_parseStatus(await self.status(timeout)))
+
+    async def verify(self, timeout=None):
+        if self.wrapper.split_paths:
+            for async_wrapper in self._pathWrappers():
+                await async_wrapper.verify(timeout)
+            return
+        await self._run(self.wrapper._verifyCmd(), timeout)
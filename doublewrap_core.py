@@ -0,0 +1,1916 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+import subprocess as sp
+import os
+import sys
+if sys.version_info.major < 3.:
+    import ConfigParser as configparser
+    from multiprocessing import cpu_count
+else:
+    import configparser
+    from os import cpu_count
+import logging
+import getpass
+import argparse
+import time
+import shutil
+import hashlib
+import fnmatch
+import tempfile
+import copy
+import itertools
+import posixpath
+import random
+import threading
+import collections
+import json
+import binascii
+import re
+import contextlib
+
+
+def _parseTime(s):
+    return int(time.mktime(time.strptime(s, '%a %b %d %H:%M:%S %Y')))
+
+
+def _parseListLine(l):
+    # duplicity list lines are '<ctime style mtime> <path>', paths may contain spaces
+    ls = l.split(None, 5)
+    if len(ls) < 6:
+        return None
+    try:
+        return _parseTime(' '.join(ls[:5])), ls[5]
+    except ValueError:
+        return None
+
+
+BackupSet = collections.namedtuple('BackupSet', ['type', 'time', 'volumes', 'chain'])
+BackupChain = collections.namedtuple('BackupChain', ['chain', 'start', 'end', 'sets'])
+
+
+def _parseStatus(lines):
+    # yields each backup set of a collection-status listing as soon as its line is read
+    chain = None
+    for l in lines:
+        ls = l.split()
+        if len(ls) == 0:
+            continue
+        if l.startswith('Found primary backup chain'):
+            chain = 'primary'
+        elif ls[0] == 'Secondary' and ls[1] == 'chain':
+            chain = 'secondary {}'.format(ls[2])
+        elif l.startswith('Also found') or l.startswith('Found orphaned') or l.startswith('Found incomplete'):
+            chain = 'orphaned'
+        elif len(ls) >= 7 and ls[0] in ['Full', 'Incremental']:
+            yield BackupSet(ls[0], _parseTime(' '.join(ls[1:6])), int(ls[6]), chain)
+
+
+def _groupChains(sets):
+    chains = collections.OrderedDict()
+    for set_ in sets:
+        chains.setdefault(set_.chain, []).append(set_)
+    return [BackupChain(chain, chain_sets[0].time, chain_sets[-1].time, chain_sets)
+            for chain, chain_sets in chains.items()]
+
+
+def _chainsToDict(chains):
+    return [{'chain': chain.chain, 'start': chain.start, 'end': chain.end,
+             'sets': [{'type': s.type, 'time': s.time, 'volumes': s.volumes} for s in chain.sets]}
+            for chain in chains]
+
+
+def _indexLine(l):
+    path, mtime = l.rstrip(b'\n').rsplit(b'\t', 1)
+    return path, int(mtime)
+
+
+def _indexSeek(f, size, key):
+    # binary search over the line starts of a sorted manifest, leaves f at the first path >= key
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        f.seek(mid)
+        if mid > 0:
+            f.readline()
+        start = f.tell()
+        if start >= hi:
+            break
+        if _indexLine(f.readline())[0] < key:
+            lo = f.tell()
+        else:
+            hi = start
+    f.seek(lo)
+    while True:
+        pos = f.tell()
+        l = f.readline()
+        if len(l) == 0 or _indexLine(l)[0] >= key:
+            f.seek(pos)
+            return
+
+
+def _pathKey(path):
+    # duplicity lists the root of the archive as '.', it sorts before everything
+    path = path.strip('/')
+    if path in ('', '.'):
+        return ()
+    return tuple(path.split('/'))
+
+
+def _filterListing(lines, prefix=None, pattern=None):
+    # duplicity lists paths in component order, so nothing under prefix follows a path past it
+    if prefix is not None:
+        prefix_key = _pathKey(prefix)
+    try:
+        for l in lines:
+            parsed = _parseListLine(l)
+            if parsed is None:
+                continue
+            path = parsed[1]
+            if prefix is not None:
+                key = _pathKey(path)
+                if key[:len(prefix_key)] != prefix_key:
+                    if key > prefix_key:
+                        break
+                    continue
+            if pattern is not None and not fnmatch.fnmatchcase(path, pattern):
+                continue
+            yield l
+    finally:
+        if hasattr(lines, 'close'):
+            lines.close()
+
+
+def _parseBackupStats(lines):
+    # the '[ Backup Statistics ]' block duplicity prints after a backup, as name -> number
+    stats = {}
+    in_block = False
+    for l in lines:
+        if 'Backup Statistics' in l:
+            in_block = True
+        elif in_block and l.startswith('---'):
+            in_block = False
+        elif in_block:
+            ls = l.split()
+            if len(ls) >= 2:
+                try:
+                    stats[ls[0]] = float(ls[1])
+                except ValueError:
+                    pass
+    return stats
+
+
+def _snakeCase(name):
+    return re.sub('(?<!^)([A-Z])', r'_\1', name).lower()
+
+
+class BackupStats(collections.namedtuple('BackupStats', [
+        'type', 'start_time', 'end_time', 'elapsed_time', 'source_files', 'source_file_size', 'new_files',
+        'new_file_size', 'deleted_files', 'changed_files', 'changed_file_size', 'changed_delta_size',
+        'delta_entries', 'raw_delta_size', 'total_destination_size_change', 'errors'])):
+    __slots__ = ()
+
+    @classmethod
+    def fromStats(cls, type_, stats):
+        values = dict((_snakeCase(key), value) for key, value in stats.items())
+        return cls(type_, *[values.get(field, 0.) for field in cls._fields[1:]])
+
+    @property
+    def throughput(self):
+        # MB of source data scanned per second
+        if self.elapsed_time <= 0:
+            return 0.
+        return self.source_file_size / 2. ** 20 / self.elapsed_time
+
+    @property
+    def change_rate(self):
+        if self.source_files <= 0:
+            return 0.
+        return (self.new_files + self.changed_files + self.deleted_files) / self.source_files
+
+    def summary(self):
+        return '{} {}: {:.1f}s, {:.2f} MB/s, {} new, {} changed, {} deleted of {} files'.format(
+            time.ctime(self.start_time), self.type, self.elapsed_time, self.throughput,
+            int(self.new_files), int(self.changed_files), int(self.deleted_files), int(self.source_files))
+
+
+class VerifyChunk(collections.namedtuple('VerifyChunk', ['paths', 'error', 'elapsed'])):
+    __slots__ = ()
+
+    def summary(self):
+        paths = ', '.join(self.paths)
+        if self.error is None:
+            return '{}: ok ({:.1f}s)'.format(paths, self.elapsed)
+        return '{}: failed ({:.1f}s): {}'.format(paths, self.elapsed, self.error)
+
+
+def _filespec(paths):
+    filespec = []
+    for path in paths:
+        filespec.extend(['--include', path])
+    filespec.append('--exclude')
+    filespec.append('/')
+    return filespec
+
+
+def _commandAction(cmd):
+    if os.path.basename(cmd[0]) in ('nice', 'ionice') and 'duplicity' in cmd:
+        cmd = cmd[cmd.index('duplicity'):]
+    name = os.path.basename(cmd[0])
+    if name == 'duplicity' and len(cmd) > 1:
+        return cmd[1]
+    return name
+
+
+class JsonMetrics(object):
+    # appends every metrics event to path as a json line
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self.lock = threading.Lock()
+
+    def __call__(self, event, data):
+        record = {'time': time.time(), 'event': event}
+        record.update(data)
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+
+def _labelValue(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_prometheus_exporters = {}
+_prometheus_lock = threading.Lock()
+
+
+class PrometheusMetrics(object):
+    # keeps totals per command and phase and rewrites a node_exporter textfile after every event
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self.lock = threading.Lock()
+        self.samples = collections.OrderedDict()
+
+    def _add(self, name, labels, value):
+        self.samples[(name, labels)] = self.samples.get((name, labels), 0) + value
+
+    def __call__(self, event, data):
+        with self.lock:
+            if event == 'command':
+                labels = (('action', data['action']),)
+                self._add('doublewrap_command_seconds_total', labels, data['seconds'])
+                self._add('doublewrap_commands_total', labels + (('exit_code', str(data['exit_code'])),), 1)
+            elif event == 'phase':
+                labels = (('phase', data['phase']),)
+                self._add('doublewrap_phase_seconds_total', labels, data['seconds'])
+                self._add('doublewrap_phases_total', labels, 1)
+            elif event == 'backup_stats':
+                # one series per archive, split_paths and fleet runs report several
+                labels = (('dest', data['dest']), ('source', data['source']))
+                for key, value in data['stats'].items():
+                    name = 'doublewrap_backup_' + _snakeCase(key)
+                    self.samples[(name, labels)] = value
+                self.samples[('doublewrap_last_backup_timestamp_seconds', labels)] = time.time()
+            self._write()
+
+    @classmethod
+    def forPath(cls, path):
+        # wrappers writing the same textfile must share one instance or they overwrite each other's samples
+        path = os.path.expanduser(path)
+        with _prometheus_lock:
+            if path not in _prometheus_exporters:
+                _prometheus_exporters[path] = cls(path)
+            return _prometheus_exporters[path]
+
+    def _write(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            for (name, labels), value in self.samples.items():
+                labelstr = ','.join('{}="{}"'.format(k, _labelValue(v)) for k, v in labels)
+                if labelstr != '':
+                    labelstr = '{' + labelstr + '}'
+                f.write('{}{} {}\n'.format(name, labelstr, value))
+        os.rename(tmp, self.path)
+
+
+def _makedirs(dir_):
+    try:
+        os.makedirs(dir_)
+    except OSError:
+        if not os.path.isdir(dir_):
+            raise
+
+
+def _removePath(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def _linkTree(src, dst):
+    # hard links where possible, the metadata of a large archive takes gigabytes. duplicity replaces
+    # the files of its archive dir rather than writing into them, so a link is never written through
+    _makedirs(dst)
+    if not os.path.isdir(src):
+        return
+    for name in os.listdir(src):
+        src_path = os.path.join(src, name)
+        dst_path = os.path.join(dst, name)
+        if name == 'lockfile':
+            continue
+        if os.path.isdir(src_path):
+            _linkTree(src_path, dst_path)
+            continue
+        try:
+            os.link(src_path, dst_path)
+        except OSError:
+            shutil.copy2(src_path, dst_path)
+
+
+def _fastImportPath(path):
+    if path.startswith('"') or '\n' in path:
+        return '"{}"'.format(path.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+    return path
+
+
+def _pathList(file_):
+    if isinstance(file_, (list, tuple)):
+        return list(file_)
+    return [file_]
+
+
+def _commonParent(files):
+    # deepest directory containing every path, '' for the whole archive
+    parts = [f.strip('/').split('/') for f in files]
+    common = []
+    for names in zip(*parts):
+        if len(set(names)) > 1:
+            break
+        common.append(names[0])
+    return '/'.join(common)
+
+
+def _fileMode(path):
+    if os.path.islink(path):
+        return '120000'
+    if os.stat(path).st_mode & 0o100:
+        return '100755'
+    return '100644'
+
+
+def _fileDigest(path):
+    # the git blob id, so versions can be compared with what is already committed
+    if os.path.islink(path):
+        data = os.readlink(path).encode('utf-8')
+        return hashlib.sha1('blob {}\0'.format(len(data)).encode('utf-8') + data).hexdigest()
+    digest = hashlib.sha1('blob {}\0'.format(os.path.getsize(path)).encode('utf-8'))
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2 ** 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _FastImportWriter(object):
+    # streams every version into one git fast-import instead of add/status/commit per version
+
+    def __init__(self, dir_, target, logger, paths=None):
+        self.dir_ = dir_
+        self.target = target.replace(os.sep, '/')
+        # only these paths below each restored version are committed, all of it when None
+        self.paths = paths
+        self.logger = logger
+        self.ref = sp.check_output(['git', 'symbolic-ref', 'HEAD'], cwd=dir_).decode().strip()
+        self.last = None
+        self.parent = None
+        if sp.call(['git', 'rev-parse', '--verify', '-q', self.ref], cwd=dir_, stdout=sp.PIPE) == 0:
+            # continuing an existing history
+            self.parent = self.ref
+            self.last = self._committed()
+        self.commits = 0
+        cmd = ['git', 'fast-import', '--quiet']
+        self.logger.info('Running command {}'.format(' '.join(cmd)))
+        self.p = sp.Popen(cmd, stdin=sp.PIPE, cwd=dir_)
+
+    def _committed(self):
+        out = sp.check_output(['git', 'ls-tree', '-r', '-z', '--full-tree', self.ref, '--', self.target],
+                              cwd=self.dir_).decode('utf-8')
+        signature = []
+        for entry in out.split('\0'):
+            if entry == '':
+                continue
+            info, gitpath = entry.split('\t', 1)
+            mode, _, digest = info.split()
+            signature.append((gitpath, mode, digest))
+        return sorted(signature)
+
+    def _files(self, restored):
+        if self.paths is not None:
+            for path in sorted(set(self.paths)):
+                selected = os.path.join(restored, path)
+                if not os.path.lexists(selected):
+                    continue
+                for found, gitpath in self._walk(selected):
+                    yield found, '/'.join([self.target, os.path.relpath(found, restored).replace(os.sep, '/')])
+            return
+        for found, gitpath in self._walk(restored):
+            yield found, gitpath
+
+    def _walk(self, restored):
+        if not os.path.isdir(restored) or os.path.islink(restored):
+            yield restored, self.target
+            return
+        for dirpath, dirnames, files in os.walk(restored):
+            dirnames.sort()
+            # os.walk lists symlinks to directories with the directories
+            names = sorted(files + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))])
+            for name in names:
+                path = os.path.join(dirpath, name)
+                yield path, '/'.join([self.target, os.path.relpath(path, restored).replace(os.sep, '/')])
+
+    def commit(self, time_, restored):
+        entries = [(gitpath, _fileMode(path), path) for path, gitpath in self._files(restored)]
+        signature = sorted((gitpath, mode, _fileDigest(path)) for gitpath, mode, path in entries)
+        if signature == self.last:
+            return False
+        self.last = signature
+        message = 'Time: {}'.format(time.ctime(time_)).encode('utf-8')
+        write = self.p.stdin.write
+        write('commit {}\n'.format(self.ref).encode('utf-8'))
+        write('committer autorecovery <autorecovery> {} +0000\n'.format(time_).encode('utf-8'))
+        write('data {}\n'.format(len(message)).encode('utf-8') + message + b'\n')
+        if self.parent is not None:
+            write('from {}^0\n'.format(self.parent).encode('utf-8'))
+            self.parent = None
+        write('D {}\n'.format(_fastImportPath(self.target)).encode('utf-8'))
+        for gitpath, mode, path in entries:
+            write('M {} inline {}\n'.format(mode, _fastImportPath(gitpath)).encode('utf-8'))
+            if mode == '120000':
+                data = os.readlink(path).encode('utf-8')
+                write('data {}\n'.format(len(data)).encode('utf-8') + data)
+            else:
+                write('data {}\n'.format(os.path.getsize(path)).encode('utf-8'))
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, self.p.stdin)
+            write(b'\n')
+        self.commits += 1
+        return True
+
+    def close(self):
+        self.p.stdin.close()
+        if self.p.wait() != 0:
+            raise sp.CalledProcessError(self.p.returncode, ['git', 'fast-import'])
+        if self.commits > 0:
+            sp.check_call(['git', 'reset', '-q', '--hard'], cwd=self.dir_)
+
+
+def _threadMap(func, items, jobs):
+    # ThreadPool(jobs).map without the cost of importing multiprocessing on every start
+    items = list(items)
+    results = [None] * len(items)
+    errors = []
+    indices = iter(range(len(items)))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                i = next(indices, None)
+            if i is None or len(errors) > 0:
+                return
+            try:
+                results[i] = func(items[i])
+            except Exception as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=worker) for _ in range(max(1, min(jobs, len(items))))]
+    for t in workers:
+        t.daemon = True
+        t.start()
+    for t in workers:
+        t.join()
+    if len(errors) > 0:
+        raise errors[0]
+    return results
+
+
+class _Async(object):
+    # func(*args) on a thread of its own, get() waits for it like ThreadPool.apply_async(...).get()
+
+    def __init__(self, func, args):
+        self.result = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, args=(func, args))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self, func, args):
+        try:
+            self.result = func(*args)
+        except Exception as e:
+            self.error = e
+
+    def get(self):
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class _ArchiveCopies(object):
+    # duplicity holds an exclusive lock on its archive dir for every action, so commands running at the
+    # same time against one destination each borrow their own copy of the local metadata
+
+    def __init__(self, shared, count):
+        self.free = []
+        self.roots = []
+        self.lock = threading.Lock()
+        if count <= 1:
+            # one command at a time works in the shared archive dir
+            self.free.append(None)
+            return
+        # next to the shared one, so hard links work
+        parent = os.path.dirname(shared)
+        _makedirs(parent)
+        try:
+            for _ in range(count):
+                root = tempfile.mkdtemp(prefix='doublewrap-', dir=parent)
+                self.roots.append(root)
+                _linkTree(shared, os.path.join(root, os.path.basename(shared)))
+                self.free.append(root)
+        except Exception:
+            self.close()
+            raise
+
+    @contextlib.contextmanager
+    def borrow(self):
+        # the --archive-dir to pass, None for the default one
+        with self.lock:
+            archive_dir = self.free.pop()
+        try:
+            yield archive_dir
+        finally:
+            with self.lock:
+                self.free.append(archive_dir)
+
+    def close(self):
+        for root in self.roots:
+            shutil.rmtree(root, ignore_errors=True)
+        self.roots = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _Command(object):
+    # stderr is drained on its own thread so a chatty child can never block on a full pipe
+    stderr_tail_lines = 100
+
+    def __init__(self, cmd, logger):
+        self.cmd = cmd
+        self.logger = logger
+        self.stderr_tail = collections.deque(maxlen=self.stderr_tail_lines)
+        self.elapsed = None
+        self.returncode = None
+        self.start = time.time()
+        self.p = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE)
+        self.drain = threading.Thread(target=self._drainStderr)
+        self.drain.daemon = True
+        self.drain.start()
+
+    def _drainStderr(self):
+        for l in iter(self.p.stderr.readline, b''):
+            l_str = l.rstrip().decode('utf-8', 'replace')
+            self.logger.info(l_str)
+            self.stderr_tail.append(l_str)
+        self.p.stderr.close()
+
+    def lines(self):
+        for l in iter(self.p.stdout.readline, b''):
+            l_str = l.strip().decode()
+            self.logger.info(l_str)
+            yield l_str
+
+    def finish(self, abandoned=False):
+        if abandoned and self.p.poll() is None:
+            self.p.terminate()
+        self.p.stdout.close()
+        self.drain.join()
+        returncode = self.returncode = self.p.wait()
+        self.elapsed = time.time() - self.start
+        self.logger.info('{} exited with {} after {:.2f}s'.format(self.cmd[0], returncode, self.elapsed))
+        if returncode != 0 and not abandoned:
+            raise sp.CalledProcessError(returncode, self.cmd, output='\n'.join(self.stderr_tail))
+
+
+class DuplicityWrapper(object):
+
+    def __init__(self, cfg_file, verbosity=0):
+        self.logger = logging.getLogger('doublewrap')
+        self.logger.addHandler(logging.NullHandler())
+
+        c = configparser.ConfigParser(allow_no_value=True)
+        c.optionxform = lambda option: option  # Preserve case
+        cfg_file = os.path.expanduser(cfg_file)
+        if not os.path.exists(cfg_file):
+            raise RuntimeError('{} does not exist.'.format(cfg_file))
+        c.read(cfg_file)
+
+        required_sections = {'AUTH': ['keyid'], 'DESTINATION': ['Host'], 'PATHS': []}
+        for section, subsections in required_sections.items():
+            if section not in c.sections():
+                raise RuntimeError('{} not found in {}'.format(section, cfg_file))
+            for subsection in subsections:
+                if subsection not in c.options(section):
+                    raise RuntimeError('{} not found in {} section of {}'.format(subsection, section, cfg_file))
+
+        if 'promt_for_passphrase' in c.options('AUTH') and c.getboolean('AUTH', 'prompt_for_passphrase'):
+            print('Warning, passphrase is stored as an environment variable', file=sys.stderr)
+            os.environ['PASSPHRASE'] = getpass.getpass()
+        else:
+            os.environ['PASSPHRASE'] = ''
+
+        srcs = []
+        for dir_ in c.options('PATHS'):
+            dir_adj = os.path.expanduser(dir_)
+            if not os.path.exists(dir_adj):
+                print('{} does not exists'.format(dir_), file=sys.stderr)
+
+            srcs.append(dir_adj)
+
+        host = c.get('DESTINATION', 'Host')
+
+        keyid = c.get('AUTH', 'keyid')
+
+        ssh_cmd = ['ssh', '-qt']
+
+        self.control_dir = None
+        self.control_path = None
+        self.ssh_options = []
+        multiplex = 'multiplex' not in c.options('DESTINATION') or c.getboolean('DESTINATION', 'multiplex')
+
+        self.port = None
+        if 'Port' in c.options('DESTINATION'):
+            self.port = c.get('DESTINATION', 'Port')
+            ssh_cmd.append('-p')
+            ssh_cmd.append(self.port)
+
+        tmp = ''
+        if 'User' in c.options('DESTINATION'):
+            tmp += c.get('DESTINATION', 'User')
+            tmp += '@'
+        tmp += host
+        ssh_cmd.append(tmp)
+
+        self.ssh_target = tmp
+        self.ssh_cmd = ssh_cmd
+
+        if 'backup_root' in c.options('DESTINATION'):
+            backup_root = c.get('DESTINATION', 'backup_root')
+            # if self.backup_root[0] == '~' or self.backup_root[0] == '/':
+            #    raise ValueError('backup_root must be specified relative to starting directory on remoted (no leading ~/ or /')
+        else:
+            backup_root = ''
+
+        # each PATHS entry gets its own archive below backup_root and they are backed up concurrently
+        self.split_paths = 'split_paths' in c.options('DESTINATION') and c.getboolean('DESTINATION', 'split_paths')
+        self.jobs = cpu_count() or 1
+        if 'jobs' in c.options('DESTINATION'):
+            self.jobs = c.getint('DESTINATION', 'jobs')
+        self.path_status = {}
+        self.verify_status = []
+
+        # when to start a new chain and how many chains to keep
+        self.policy = {}
+        if 'POLICY' in c.sections():
+            for option, getter in [('max_incrementals', c.getint), ('max_age', c.getfloat),
+                                   ('max_incremental_ratio', c.getfloat), ('keep_full', c.getint)]:
+                if option in c.options('POLICY'):
+                    self.policy[option] = getter('POLICY', option)
+
+        # how hard a backup may use the uplink and the local machine
+        self.throttle = {}
+        if 'THROTTLE' in c.sections():
+            for option, getter in [('bwlimit', c.getint), ('nice', c.getint), ('ionice_class', c.getint),
+                                   ('ionice_level', c.getint), ('volsize', c.get),
+                                   ('asynchronous_upload', c.get), ('hours', c.get)]:
+                if option in c.options('THROTTLE'):
+                    self.throttle[option] = getter('THROTTLE', option)
+            if 'hours' in self.throttle:
+                self.throttle['hours'] = [int(h) for h in self.throttle['hours'].split('-')]
+                if len(self.throttle['hours']) != 2:
+                    raise RuntimeError('hours in THROTTLE section of {} must look like 8-18'.format(cfg_file))
+
+        # status and list are answered from the cache only, without contacting the remote
+        self.offline = False
+
+        self.c = c
+        self.host = host
+        self.keyid = keyid
+        self.restore_counts = {'restored': 0, 'skipped': 0}
+        self.command_timings = []
+        self.metrics_callbacks = []
+        if 'METRICS' in c.sections():
+            if 'json' in c.options('METRICS'):
+                self.addMetricsCallback(JsonMetrics(c.get('METRICS', 'json')))
+            if 'prometheus' in c.options('METRICS'):
+                self.addMetricsCallback(PrometheusMetrics.forPath(c.get('METRICS', 'prometheus')))
+        # backup statistics history is kept outside of the evictable cache
+        if 'METRICS' in c.sections() and 'history_dir' in c.options('METRICS'):
+            self.history_root = os.path.expanduser(c.get('METRICS', 'history_dir'))
+        else:
+            self.history_root = os.path.join(os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share')),
+                                             'doublewrap')
+        self.history_size = 1000
+        if 'METRICS' in c.sections() and 'history_size' in c.options('METRICS'):
+            self.history_size = c.getint('METRICS', 'history_size')
+        self.base_duplicity_cmd = ['duplicity',
+                                   '--encrypt-key', self.keyid,
+                                   '--encrypt-sign-key', self.keyid,
+                                   '--verbosity', str(verbosity)]
+
+        if 'CACHE' in c.sections() and 'dir' in c.options('CACHE'):
+            self.cache_root = os.path.expanduser(c.get('CACHE', 'dir'))
+        else:
+            self.cache_root = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'doublewrap')
+        self.cache_max_size = 100 * 2 ** 20
+        if 'CACHE' in c.sections() and 'max_size' in c.options('CACHE'):
+            self.cache_max_size = int(c.getfloat('CACHE', 'max_size') * 2 ** 20)
+        # duplicity's own metadata cache, the default of its --archive-dir
+        self.archive_root = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'duplicity')
+
+        # one multiplexed connection per instance, shared by every remote command and duplicity. the
+        # directory is only made by _connect, so offline and local commands never create one
+        if multiplex:
+            self.control_dir = os.path.join(tempfile.gettempdir(), 'doublewrap-ssh-{}'.format(
+                binascii.hexlify(os.urandom(8)).decode()))
+            self.control_path = os.path.join(self.control_dir, 'control')
+            self.ssh_options = ['-oControlMaster=auto',
+                                '-oControlPath={}'.format(self.control_path),
+                                '-oControlPersist=60']
+            self.ssh_cmd[2:2] = self.ssh_options
+            self.base_duplicity_cmd.extend(['--ssh-options', ' '.join(self.ssh_options)])
+
+        self._setTarget(backup_root, srcs)
+
+    def _setTarget(self, backup_root, srcs):
+        self.backup_root = backup_root
+        self.srcs = srcs
+        # filled in by probeRemote the first time a command needs the remote
+        self.remote_listing = None
+        self.remote_sizes = {}
+        self.remote_fingerprint = None
+
+        if self.port is not None:
+            portstr = ':{}'.format(self.port)
+        else:
+            portstr = ''
+        self.deststr = 'rsync://{}{}/{}'.format(self.host, portstr, self.backup_root)
+        self.cache_dir = os.path.join(self.cache_root, hashlib.sha1(self.deststr.encode('utf-8')).hexdigest())
+        self.history_path = os.path.join(self.history_root,
+                                         hashlib.sha1(self.deststr.encode('utf-8')).hexdigest() + '.jsonl')
+
+        self.filespec = _filespec(self.srcs)
+
+    def pathWrappers(self):
+        wrappers = []
+        for src in self.srcs:
+            name = '{}-{}'.format(src.strip('/').replace('/', '_'), hashlib.sha1(src.encode('utf-8')).hexdigest()[:8])
+            wrapper = copy.copy(self)
+            wrapper.split_paths = False
+            # the ssh master belongs to this instance
+            wrapper.control_dir = None
+            wrapper._setTarget(posixpath.join(self.backup_root, name), [src])
+            wrappers.append(wrapper)
+        return wrappers
+
+    def _wrapperFor(self, file_):
+        if not self.split_paths:
+            return self
+        path = '/' + file_.lstrip('/')
+        for wrapper in self.pathWrappers():
+            src = wrapper.srcs[0].rstrip('/')
+            if path == src or path.startswith(src + '/'):
+                return wrapper
+        raise RuntimeError('{} is not below any entry of PATHS'.format(file_))
+
+    def addMetricsCallback(self, callback):
+        # callback(event, data) is called for every 'command', 'phase' and 'backup_stats' event
+        self.metrics_callbacks.append(callback)
+
+    def _emit(self, event, data):
+        for callback in self.metrics_callbacks:
+            try:
+                callback(event, data)
+            except Exception:
+                self.logger.exception('metrics callback failed')
+
+    @contextlib.contextmanager
+    def _phase(self, phase, **labels):
+        start = time.time()
+        try:
+            yield
+        finally:
+            labels.update({'phase': phase, 'seconds': time.time() - start})
+            self._emit('phase', labels)
+
+    def _commandFinished(self, cmd, elapsed, returncode):
+        self.command_timings.append((cmd, elapsed))
+        self._emit('command', {'action': _commandAction(cmd), 'cmd': cmd, 'seconds': elapsed,
+                               'exit_code': returncode})
+
+    def close(self):
+        if self.control_dir is None:
+            return
+        if os.path.exists(os.path.join(self.control_dir, 'control')):
+            exit_cmd = self._exitCmd()
+            self.logger.info('executing {}'.format(' '.join(exit_cmd)))
+            sp.call(exit_cmd)
+        shutil.rmtree(self.control_dir, ignore_errors=True)
+        self.control_dir = None
+        self.control_path = None
+
+    def _connect(self):
+        # called before anything that may talk to the remote, path wrappers share the directory
+        if self.control_path is None:
+            return
+        try:
+            os.mkdir(os.path.dirname(self.control_path), 0o700)
+        except OSError:
+            if not os.path.isdir(os.path.dirname(self.control_path)):
+                raise
+
+    def _exitCmd(self):
+        return ['ssh', '-q', self.ssh_options[1], '-O', 'exit', self.ssh_target]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def remoteLs(self, dir_=None):
+        ls_cmd = list(self.ssh_cmd)
+        ls_cmd.extend(['ls', '-a'])
+        if dir_ is not None:
+            ls_cmd.append(dir_)
+        self._connect()
+        self.logger.info('executing {}'.format(' '.join(ls_cmd)))
+        return sp.check_output(ls_cmd).decode().split()
+
+    def remoteFingerprint(self):
+        # names, sizes and mtimes of the archive files change whenever duplicity writes to it, from here or
+        # from any other host, so the remote is probed again for every fingerprint
+        self.remote_listing = None
+        self.probeRemote()
+        return self.remote_fingerprint
+
+    def checkAndMake(self, loc_to_check, dir_):
+        remote_ls = self.remoteLs(loc_to_check)
+        if dir_ not in remote_ls:
+            mkdir_cmd = list(self.ssh_cmd)
+            mkdir_cmd.append('mkdir')
+            if loc_to_check != '':
+                mkdir_cmd.append(os.path.join(loc_to_check, dir_))
+            else:
+                mkdir_cmd.append(dir_)
+            self.logger.info('executing {}'.format(' '.join(mkdir_cmd)))
+            sp.check_call(mkdir_cmd)
+            remote_ls = self.remoteLs(loc_to_check)
+            if dir_ not in remote_ls:
+                raise RuntimeError('Unable to create {} in {} at remote'.format(dir_, loc_to_check))
+            return False
+        return True
+
+    def probeRemote(self):
+        # creates backup_root and lists it in a single round trip
+        if self.remote_listing is None:
+            probe_cmd = self._probeCmd()
+            self._connect()
+            self.logger.info('executing {}'.format(' '.join(probe_cmd)))
+            with self._phase('probe'):
+                self._setRemoteListing(sp.check_output(probe_cmd).decode())
+        return self.remote_listing
+
+    def _setRemoteListing(self, out):
+        self.remote_listing = []
+        self.remote_sizes = {}
+        fingerprint = []
+        for l in out.splitlines():
+            ls = l.split()
+            if len(ls) < 9:
+                continue
+            name = ' '.join(ls[8:])
+            self.remote_listing.append(name)
+            self.remote_sizes[name] = int(ls[4])
+            # . and .. also change when something next to backup_root is written
+            if name not in ('.', '..'):
+                fingerprint.append(' '.join(ls[4:]))
+        self.remote_fingerprint = hashlib.sha1('\n'.join(fingerprint).encode('utf-8')).hexdigest()
+
+    def _probeCmd(self):
+        probe_cmd = list(self.ssh_cmd)
+        if self.backup_root != '':
+            self.logger.info('Checking for {} on remote'.format(self.backup_root))
+            probe_cmd.extend(['mkdir', '-p', self.backup_root, '&&', 'ls', '-la', self.backup_root])
+        else:
+            probe_cmd.extend(['ls', '-la'])
+        return probe_cmd
+
+    def dirContainsSigs(self, dir_=None):
+        if dir_ is None or dir_ == self.backup_root:
+            remote_ls = self.probeRemote()
+        else:
+            remote_ls = self.remoteLs(dir_)
+        return self._containsSigs(remote_ls)
+
+    def _containsSigs(self, remote_ls):
+        for file_ in remote_ls:
+            if 'duplicity-full-signatures' in file_:
+                return True
+        return False
+
+    def runAndLog(self, cmd, yieldoutput=False):
+        self._connect()
+        self.logger.info('Running command {}'.format(' '.join(cmd)))
+        command = _Command(cmd, self.logger)
+        if yieldoutput:
+            return self._runAndLogYield(command)
+        else:
+            self._runAndLogQuiet(command)
+
+    def _runAndLogYield(self, command):
+        complete = False
+        try:
+            for l in command.lines():
+                yield l
+            complete = True
+        finally:
+            # ensures that cleanup is run even if generator
+            # isn't exhausted, an abandoned command is stopped
+            self._cleanup(command, abandoned=not complete)
+
+    def _runAndLogQuiet(self, command):
+        for l in command.lines():
+            pass
+        self._cleanup(command)
+
+    def _cleanup(self, command, abandoned=False):
+        try:
+            command.finish(abandoned)
+        finally:
+            self._commandFinished(command.cmd, command.elapsed, command.returncode)
+
+    def backup(self, *args):
+        if self.split_paths:
+            return self._backupPaths(args)
+
+        with self._phase('backup'):
+            remote_ls = self.probeRemote()
+            chains = []
+            if self._containsSigs(remote_ls) and self._rotationPolicy():
+                chains = self.backupChains()
+            incremental = not self._needsFull(remote_ls, chains)
+            backup_cmd = self._backupCmd(incremental, args)
+            try:
+                stats = _parseBackupStats(self.runAndLog(backup_cmd, yieldoutput=True))
+            finally:
+                self.remote_listing = None
+            backup_stats = self._recordBackup('incr' if incremental else 'full', stats)
+            if 'keep_full' in self.policy:
+                self.runAndLog(self._cleanupCmd())
+        return backup_stats
+
+    def _recordBackup(self, type_, stats):
+        self._emit('backup_stats', {'dest': self.deststr, 'backup_root': self.backup_root,
+                                    'source': ','.join(self.srcs), 'stats': stats})
+        if len(stats) == 0:
+            self.logger.warning('duplicity printed no backup statistics')
+            return None
+        backup_stats = BackupStats.fromStats(type_, stats)
+        history = self._readHistory()
+        history.append(json.dumps(backup_stats._asdict()))
+        _makedirs(os.path.dirname(self.history_path))
+        tmp = self.history_path + '.tmp'
+        with open(tmp, 'w') as f:
+            for l in history[-self.history_size:]:
+                f.write(l + '\n')
+        os.rename(tmp, self.history_path)
+        return backup_stats
+
+    def _readHistory(self):
+        if not os.path.exists(self.history_path):
+            return []
+        with open(self.history_path) as f:
+            return [l.rstrip('\n') for l in f if l.strip() != '']
+
+    def backupHistory(self):
+        if self.split_paths:
+            return dict((w.srcs[0], w.backupHistory()) for w in self.pathWrappers())
+        history = []
+        for l in self._readHistory():
+            values = json.loads(l)
+            history.append(BackupStats(*[values[field] for field in BackupStats._fields]))
+        return history
+
+    def _rotationPolicy(self):
+        return len(set(self.policy) & set(['max_incrementals', 'max_age', 'max_incremental_ratio'])) > 0
+
+    def _chainSizes(self, start):
+        # bytes of the full and of all incrementals since, from the probed remote listing
+        stamp = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(start))
+        full_size = 0
+        inc_size = 0
+        for name, size in self.remote_sizes.items():
+            parts = name.split('.')
+            if len(parts) < 2 or '.difftar' not in name:
+                continue
+            if parts[0] == 'duplicity-full' and parts[1] == stamp:
+                full_size += size
+            elif parts[0] == 'duplicity-inc' and parts[1] >= stamp:
+                inc_size += size
+        return full_size, inc_size
+
+    def _needsFull(self, remote_ls, chains):
+        if not self._containsSigs(remote_ls):
+            return True
+        primary = [chain for chain in chains if chain.chain == 'primary']
+        if len(primary) == 0:
+            return False
+        chain = primary[0]
+        incrementals = len(chain.sets) - 1
+        if 'max_incrementals' in self.policy and incrementals >= self.policy['max_incrementals']:
+            self.logger.info('Starting a new chain, {} incrementals since the last full'.format(incrementals))
+            return True
+        age = (time.time() - chain.start) / 86400.
+        if 'max_age' in self.policy and age >= self.policy['max_age']:
+            self.logger.info('Starting a new chain, last full is {:.1f} days old'.format(age))
+            return True
+        if 'max_incremental_ratio' in self.policy:
+            full_size, inc_size = self._chainSizes(chain.start)
+            if full_size > 0 and float(inc_size) / full_size >= self.policy['max_incremental_ratio']:
+                self.logger.info('Starting a new chain, incrementals are {:.2f} times the full'.format(
+                    float(inc_size) / full_size))
+                return True
+        return False
+
+    def _cleanupCmd(self):
+        cleanup_cmd = list(self.base_duplicity_cmd)
+        cleanup_cmd.insert(1, 'remove-all-but-n-full')
+        cleanup_cmd.insert(2, str(self.policy['keep_full']))
+        cleanup_cmd.append('--force')
+        cleanup_cmd.append(self.deststr)
+        return cleanup_cmd
+
+    def _backupCmd(self, incremental, args):
+        backup_cmd = list(self.base_duplicity_cmd)
+        if incremental:
+            # file already existed
+            backup_cmd.insert(1, 'incr')
+        else:
+            backup_cmd.insert(1, 'full')
+        backup_cmd.extend(self._throttleOptions())
+        for arg in args:
+            backup_cmd.append(arg)
+        backup_cmd.extend(self.filespec)
+        backup_cmd.append('/')
+        backup_cmd.append(self.deststr)
+        return self._priorityCmd() + backup_cmd
+
+    def _throttleActive(self):
+        if 'hours' not in self.throttle:
+            return True
+        start, end = self.throttle['hours']
+        hour = time.localtime().tm_hour
+        if start <= end:
+            return start <= hour < end
+        # a window across midnight, e.g. 22-6
+        return hour >= start or hour < end
+
+    def _priorityCmd(self):
+        priority_cmd = []
+        if not self._throttleActive():
+            return priority_cmd
+        if 'nice' in self.throttle:
+            priority_cmd.extend(['nice', '-n', str(self.throttle['nice'])])
+        if 'ionice_class' in self.throttle:
+            priority_cmd.extend(['ionice', '-c', str(self.throttle['ionice_class'])])
+            if 'ionice_level' in self.throttle:
+                priority_cmd.extend(['-n', str(self.throttle['ionice_level'])])
+        return priority_cmd
+
+    def _linkRate(self, history):
+        # bytes per second written to the destination by recent backups, None without history
+        rates = sorted(stats.total_destination_size_change / stats.elapsed_time
+                       for stats in history[-10:]
+                       if stats.elapsed_time > 0 and stats.total_destination_size_change > 0)
+        if len(rates) == 0:
+            return None
+        return rates[len(rates) // 2]
+
+    def _throttleOptions(self):
+        options = []
+        bwlimit = self.throttle.get('bwlimit') if self._throttleActive() else None
+        if bwlimit is not None:
+            # one argument, duplicity >= 2.0 rejects an option value that looks like an option
+            options.append('--rsync-options=--bwlimit={}'.format(bwlimit))
+        volsize = self.throttle.get('volsize')
+        asynchronous_upload = self.throttle.get('asynchronous_upload', 'no').lower()
+        rate = None
+        if volsize == 'auto' or asynchronous_upload == 'auto':
+            history = self.backupHistory()
+            rate = self._linkRate(history)
+            if rate is not None and bwlimit is not None:
+                rate = min(rate, bwlimit * 1024.)
+        if volsize == 'auto':
+            if rate is not None:
+                # about a minute of upload per volume, within duplicity's sensible range
+                options.extend(['--volsize', str(int(min(max(rate * 60 / 2 ** 20, 5), 500)))])
+        elif volsize is not None:
+            options.extend(['--volsize', volsize])
+        if asynchronous_upload == 'auto':
+            # overlap the upload with building the next volume when the link is slower than the source
+            if rate is not None and rate / 2 ** 20 < history[-1].throughput:
+                options.append('--asynchronous-upload')
+        elif asynchronous_upload in ('yes', 'true', 'on', '1'):
+            options.append('--asynchronous-upload')
+        return options
+
+    def _backupPaths(self, args):
+        def backupOne(wrapper):
+            start = time.time()
+            stats = None
+            try:
+                stats = wrapper.backup(*args)
+                error = None
+            except (RuntimeError, sp.CalledProcessError) as e:
+                error = e
+            return wrapper.srcs[0], error, time.time() - start, stats
+
+        return self._pathResults(_threadMap(backupOne, self.pathWrappers(), self.jobs))
+
+    def _pathResults(self, results):
+        self.path_status = {}
+        failed = []
+        for src, error, elapsed, stats in results:
+            self.path_status[src] = {'error': error, 'elapsed': elapsed, 'stats': stats}
+            if error is None:
+                self.logger.info('Backed up {} in {:.1f}s'.format(src, elapsed))
+            else:
+                self.logger.error('Backup of {} failed after {:.1f}s: {}'.format(src, elapsed, error))
+                failed.append(src)
+        if len(failed) > 0:
+            raise RuntimeError('Backup failed for {}'.format(', '.join(failed)))
+        return dict((src, status['stats']) for src, status in self.path_status.items())
+
+    def restore(self, target, file_=None, time_=None):
+        if self.split_paths:
+            if file_ is None:
+                raise RuntimeError('split_paths is set, a file to restore is required')
+            return self._wrapperFor(file_).restore(target, file_, time_)
+        self.runAndLog(self._restoreCmd(target, file_, time_))
+
+    def _restoreCmd(self, target, file_=None, time_=None, archive_dir=None):
+        restore_cmd = list(self.base_duplicity_cmd)
+        restore_cmd.insert(1, 'restore')
+        if archive_dir is not None:
+            restore_cmd.extend(['--archive-dir', archive_dir])
+        if file_ is not None:
+            restore_cmd.append('--file-to-restore')
+            restore_cmd.append(file_)
+        if time_ is not None:
+            restore_cmd.append('--restore-time')
+            restore_cmd.append(str(time_))
+        restore_cmd.append(self.deststr)
+        restore_cmd.append(target)
+        return restore_cmd
+
+    def _listCmd(self, time_=None):
+        list_cmd = list(self.base_duplicity_cmd)
+        list_cmd.insert(1, 'list')
+        if time_ is not None:
+            list_cmd.append('--restore-time')
+            list_cmd.append(str(time_))
+        list_cmd.append(self.deststr)
+        return list_cmd
+
+    def listfiles(self, time_=None, prefix=None, pattern=None):
+        if self.split_paths:
+            return itertools.chain.from_iterable(w.listfiles(time_, prefix, pattern) for w in self.pathWrappers())
+        if time_ is not None and (prefix is not None or pattern is not None):
+            # a snapshot never changes, so its manifest answers without listing the archive again
+            return self._manifestListing(time_, prefix, pattern)
+        lines = self._runCached(self._listCmd(time_))
+        if prefix is None and pattern is None:
+            return lines
+        return _filterListing(lines, prefix, pattern)
+
+    def _manifestListing(self, time_, prefix, pattern):
+        key = '' if prefix is None else prefix.strip('/')
+        if key == '':
+            entries = sorted(self.manifest(time_).items())
+        else:
+            entries = self.manifestEntries(time_, key)
+        for path, mtime in entries:
+            if pattern is None or fnmatch.fnmatchcase(path, pattern):
+                # the same line duplicity list prints
+                yield '{} {}'.format(time.asctime(time.localtime(mtime)), path)
+
+    def verify(self, jobs=None, subtrees=False, sample=None):
+        # with any of the options the work is split into chunks that are verified concurrently
+        if jobs is not None or subtrees or sample is not None:
+            return self._verifyChunks(self.jobs if jobs is None else jobs, subtrees, sample)
+        if self.split_paths:
+            for wrapper in self.pathWrappers():
+                wrapper.verify()
+            return
+        self.runAndLog(self._verifyCmd())
+
+    def _verifyChunks(self, jobs, subtrees, sample):
+        tasks = []
+        for wrapper in (self.pathWrappers() if self.split_paths else [self]):
+            for paths in wrapper._chunkPaths(subtrees, sample):
+                tasks.append((wrapper, paths))
+
+        def verifyOne(task):
+            wrapper, paths = task
+            copies = archive_copies[wrapper.deststr]
+            start = time.time()
+            filelist = None
+            try:
+                if len(paths) > 1:
+                    # a large sample would not fit on the command line
+                    fd, filelist = tempfile.mkstemp(prefix='doublewrap-verify-')
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(''.join(path + '\n' for path in paths).encode('utf-8'))
+                with self._phase('verify_chunk', chunk=paths[0], files=len(paths)), copies.borrow() as archive_dir:
+                    wrapper.runAndLog(wrapper._verifyCmd(paths, filelist, archive_dir))
+                error = None
+            except sp.CalledProcessError as e:
+                error = e
+            finally:
+                if filelist is not None:
+                    os.remove(filelist)
+            return VerifyChunk(paths, error, time.time() - start)
+
+        # chunks of the same destination would otherwise wait on each other's archive dir lock
+        archive_copies = {}
+        try:
+            for wrapper, _ in tasks:
+                if wrapper.deststr not in archive_copies:
+                    count = len([task for task in tasks if task[0].deststr == wrapper.deststr])
+                    archive_copies[wrapper.deststr] = wrapper._archiveCopies(min(jobs, count))
+            self.verify_status = _threadMap(verifyOne, tasks, jobs)
+        finally:
+            for copies in archive_copies.values():
+                copies.close()
+        failed = [chunk for chunk in self.verify_status if chunk.error is not None]
+        if len(failed) > 0:
+            raise RuntimeError('Verify failed for {}'.format(', '.join(', '.join(c.paths) for c in failed)))
+        return self.verify_status
+
+    def _chunkPaths(self, subtrees, sample):
+        # one chunk per PATHS entry, per entry directly below one, or of sample random files per entry
+        if not subtrees and sample is None:
+            return [[src] for src in self.srcs]
+        times = list(self._getTimes())
+        if len(times) == 0:
+            raise RuntimeError('No backups to verify')
+        chunks = []
+        for src in self.srcs:
+            key = src.strip('/')
+            entries = [path for path, _ in self.manifestEntries(times[-1], key)]
+            if sample is not None:
+                parents = set(posixpath.dirname(path) for path in entries)
+                files = [path for path in entries if path not in parents]
+                chosen = random.sample(files, min(sample, len(files)))
+                if len(chosen) > 0:
+                    chunks.append(['/' + path for path in sorted(chosen)])
+            else:
+                children = sorted(set(path for path in entries if posixpath.dirname(path) == key))
+                chunks.extend([['/' + path] for path in children] or [[src]])
+        return chunks
+
+    def _verifyCmd(self, paths=None, filelist=None, archive_dir=None):
+        verify_cmd = list(self.base_duplicity_cmd)
+        verify_cmd.insert(1, 'verify')
+        if archive_dir is not None:
+            verify_cmd.extend(['--archive-dir', archive_dir])
+        if filelist is not None:
+            verify_cmd.extend(['--include-filelist', filelist, '--exclude', '/'])
+        else:
+            verify_cmd.extend(self.filespec if paths is None else _filespec(paths))
+        verify_cmd.append(self.deststr)
+        verify_cmd.append('/')
+        return verify_cmd
+
+    def status(self, display=True, as_json=False):
+        if as_json:
+            chains = self.backupChains()
+            if self.split_paths:
+                out = json.dumps(dict((src, _chainsToDict(c)) for src, c in chains.items()), indent=2,
+                                 sort_keys=True)
+            else:
+                out = json.dumps(_chainsToDict(chains), indent=2)
+            if display:
+                print(out)
+                return
+            return out
+        if not display:
+            out = []
+        for line in self._iterstatus():
+            if display:
+                print(line)
+            else:
+                out.append(line)
+        if not display:
+            return out
+
+    def _iterstatus(self):
+        if self.split_paths:
+            return itertools.chain.from_iterable(itertools.chain(['{}:'.format(w.srcs[0])], w._iterstatus())
+                                                 for w in self.pathWrappers())
+        return self._runCached(self._statusCmd())
+
+    def _archiveCopies(self, count):
+        # duplicity names the archive dir of a destination after the md5 of its url
+        shared = os.path.join(self.archive_root, hashlib.md5(self.deststr.encode('utf-8')).hexdigest())
+        return _ArchiveCopies(shared, count)
+
+    def _statusCmd(self):
+        status_cmd = list(self.base_duplicity_cmd)
+        status_cmd.insert(1, 'collection-status')
+        status_cmd.append(self.deststr)
+        return status_cmd
+
+    def _runCached(self, cmd):
+        if self.offline:
+            return self._readOffline(cmd)
+        key = '{}\n{}'.format(self._cacheKey(cmd), self.remoteFingerprint())
+        path = os.path.join(self.cache_dir, 'runs', hashlib.sha1(key.encode('utf-8')).hexdigest())
+        if os.path.exists(path):
+            self.logger.info('Using cached output of {}'.format(' '.join(cmd)))
+            self._setLatest(cmd, path)
+            return self._readCached(path)
+        return self._runAndCache(path, cmd)
+
+    def _cacheKey(self, cmd):
+        # the ssh control path differs for every instance and must not split the cache
+        if '--ssh-options' in cmd:
+            i = cmd.index('--ssh-options')
+            cmd = cmd[:i] + cmd[i + 2:]
+        return ' '.join(cmd)
+
+    def _latestPath(self, cmd):
+        key = self._cacheKey(cmd)
+        return os.path.join(self.cache_dir, 'latest', hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _setLatest(self, cmd, path):
+        # remembers the newest cached output of cmd whatever the remote looked like, for offline use
+        latest = self._latestPath(cmd)
+        _makedirs(os.path.dirname(latest))
+        with open(latest + '.tmp', 'w') as f:
+            f.write(os.path.basename(path))
+        os.rename(latest + '.tmp', latest)
+
+    def _readOffline(self, cmd):
+        latest = self._latestPath(cmd)
+        path = None
+        if os.path.exists(latest):
+            with open(latest) as f:
+                path = os.path.join(self.cache_dir, 'runs', f.read().strip())
+        if path is None or not os.path.exists(path):
+            raise RuntimeError('offline and no cached output of {}'.format(' '.join(cmd)))
+        self.logger.info('Using cached output of {} from {}'.format(' '.join(cmd), time.ctime(os.path.getmtime(path))))
+        return self._readCached(path)
+
+    def _readCached(self, path):
+        os.utime(path, None)
+        with open(path, 'rb') as f:
+            lines = f.read().decode('utf-8').split('\n')
+        return iter(lines[:-1])
+
+    def _runAndCache(self, path, cmd):
+        _makedirs(os.path.dirname(path))
+        tmp = path + '.tmp'
+        complete = False
+        try:
+            with open(tmp, 'wb') as f:
+                for l in self.runAndLog(cmd, yieldoutput=True):
+                    f.write('{}\n'.format(l).encode('utf-8'))
+                    yield l
+            complete = True
+        finally:
+            # output of a failed or abandoned run is never cached
+            if complete:
+                os.rename(tmp, path)
+                self._setLatest(cmd, path)
+                self._evictCache(keep=path)
+            elif os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _evictCache(self, keep=None):
+        # least recently used entries go first, hits refresh the mtime. keep is about to be read and
+        # stays even if it alone is over the limit. other threads and processes share the cache root,
+        # so files being written are left alone and files may vanish while walking
+        root = os.path.dirname(self.cache_dir)
+        entries = []
+        total = 0
+        for dirpath, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                total += st.st_size
+                if name.endswith('.tmp') or path == keep:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.cache_max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def backupSets(self):
+        # every archive has its own chains, so split_paths gives them per PATHS entry
+        if self.split_paths:
+            return dict((w.srcs[0], w.backupSets()) for w in self.pathWrappers())
+        return _parseStatus(self._iterstatus())
+
+    def backupChains(self):
+        if self.split_paths:
+            return dict((w.srcs[0], w.backupChains()) for w in self.pathWrappers())
+        return _groupChains(self.backupSets())
+
+    def _getTimes(self):
+        for set_ in self.backupSets():
+            yield set_.time
+
+    def _manifestPath(self, time_):
+        return os.path.join(self.cache_dir, 'manifest', '{}.idx'.format(time_))
+
+    def _readManifest(self, path):
+        entries = {}
+        with open(path, 'rb') as f:
+            for l in f:
+                file_, mtime = _indexLine(l)
+                entries[file_.decode('utf-8')] = mtime
+        return entries
+
+    def _writeManifest(self, path, entries):
+        # sorted by the encoded path so lookups can bisect the file
+        _makedirs(os.path.dirname(path))
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            for file_, mtime in sorted((file_.encode('utf-8'), mtime) for file_, mtime in entries.items()):
+                f.write(file_ + '\t{}\n'.format(mtime).encode('utf-8'))
+        os.rename(tmp, path)
+
+    def _manifestFile(self, time_):
+        # a snapshot never changes once written, so its listing is cached for good
+        path = self._manifestPath(time_)
+        if os.path.exists(path):
+            os.utime(path, None)
+            return path
+        if self.offline:
+            raise RuntimeError('offline and no cached listing of {}'.format(time.ctime(time_)))
+        entries = {}
+        with self._phase('manifest', time=time_):
+            for l in self.runAndLog(self._listCmd(time_), yieldoutput=True):
+                parsed = _parseListLine(l)
+                if parsed is not None:
+                    entries[parsed[1]] = parsed[0]
+        self._writeManifest(path, entries)
+        self._evictCache(keep=path)
+        return path
+
+    def manifest(self, time_):
+        return self._readManifest(self._manifestFile(time_))
+
+    def manifestEntries(self, time_, file_, recursive=True):
+        # (path, mtime) of file_ and, if recursive, everything below it
+        path = self._manifestFile(time_)
+        size = os.path.getsize(path)
+        key = file_.encode('utf-8')
+        prefix = file_.rstrip('/').encode('utf-8') + b'/'
+        entries = []
+        with open(path, 'rb') as f:
+            _indexSeek(f, size, key)
+            l = f.readline()
+            if len(l) > 0 and _indexLine(l)[0] == key:
+                entries.append((file_, _indexLine(l)[1]))
+            if recursive:
+                _indexSeek(f, size, prefix)
+                for l in f:
+                    child, mtime = _indexLine(l)
+                    if not child.startswith(prefix):
+                        break
+                    entries.append((child.decode('utf-8'), mtime))
+        return entries
+
+    def fileVersions(self, file_):
+        if self.split_paths:
+            return self._wrapperFor(file_).fileVersions(file_)
+        versions = []
+        for time_ in self._getTimes():
+            entries = self.manifestEntries(time_, file_, recursive=False)
+            if len(entries) > 0:
+                versions.append((time_, entries[0][1]))
+        return versions
+
+    def _fileSignatures(self, file_):
+        # the paths and, for directories, everything below them along with their mtimes
+        files = _pathList(file_)
+        for time_ in self._getTimes():
+            signature = []
+            for f in files:
+                entries = self.manifestEntries(time_, f)
+                if len(entries) > 0 and entries[0][0] == f:
+                    signature.extend(entries)
+            if len(signature) > 0:
+                yield time_, signature
+
+    def _dedupVersions(self, file_):
+        if self.split_paths:
+            return self._wrapperFor(_pathList(file_)[0])._dedupVersions(file_)
+        changes = []
+        last = None
+        skipped = 0
+        for time_, signature in self._fileSignatures(file_):
+            if signature == last:
+                skipped += 1
+            else:
+                changes.append(time_)
+            last = signature
+        return changes, skipped
+
+    def fileChanges(self, file_):
+        return self._dedupVersions(file_)[0]
+
+    def restoreGit(self, dir_, file_, target, jobs=1):
+        # file_ may also be a list of files and directories, they are then committed together below target
+        files = _pathList(file_)
+        if self.split_paths:
+            wrapper = self._wrapperFor(files[0])
+            if len(set(self._wrapperFor(f).srcs[0] for f in files)) > 1:
+                raise RuntimeError('split_paths is set, all files must be below the same PATHS entry')
+            wrapper.restoreGit(dir_, file_, target, jobs)
+            self.restore_counts = wrapper.restore_counts
+            return
+        checkpoint = None
+        if os.path.exists(dir_) and len(os.listdir(dir_)) > 0:
+            checkpoint = self._gitCheckpoint(dir_, files, target)
+        else:
+            _makedirs(dir_)
+            self._gitinit(dir_)
+            self._gitcfg(dir_)
+            for f in files:
+                sp.check_call(['git', 'config', '--add', 'doublewrap.file', f], cwd=dir_)
+            sp.check_call(['git', 'config', 'doublewrap.target', target], cwd=dir_)
+        fulltar = os.path.join(dir_, target)
+        times, skipped = self._dedupVersions(files)
+        if checkpoint is not None:
+            self.logger.info('Resuming after {}'.format(time.ctime(checkpoint)))
+            times = [time_ for time_ in times if time_ > checkpoint]
+        self.restore_counts = {'restored': len(times), 'skipped': skipped}
+        self.logger.info('Restoring {} versions of {}, skipping {} unchanged'.format(
+            len(times), ', '.join(files), skipped))
+        paths = None
+        parent = files[0]
+        if len(files) > 1:
+            # one restore of the common parent per version instead of one per file
+            parent = _commonParent(files)
+            paths = [posixpath.relpath(f, parent) if parent != '' else f for f in files]
+            if parent == '':
+                # rather than the whole archive, the common parent of each top level directory
+                tops = sorted(set(f.strip('/').split('/')[0] for f in files))
+                parent = [_commonParent([f for f in files if f.strip('/').split('/')[0] == top]) for top in tops]
+                self.logger.info('Restoring {} for every version'.format(', '.join(parent)))
+            else:
+                self.logger.info('Restoring {} for every version'.format(parent))
+        # scratch space inside .git is ignored by git and on the same filesystem as the target
+        scratch_root = tempfile.mkdtemp(dir=os.path.join(dir_, '.git'))
+        writer = _FastImportWriter(dir_, os.path.relpath(fulltar, dir_), self.logger, paths)
+        done = None
+        versions = self._restoreVersions(parent, times, scratch_root, jobs)
+        try:
+            for time_, restored in versions:
+                with self._phase('git_commit', time=time_):
+                    writer.commit(time_, restored)
+                _removePath(os.path.dirname(restored))
+                done = time_
+        finally:
+            versions.close()
+            shutil.rmtree(scratch_root, ignore_errors=True)
+            with self._phase('git_close'):
+                writer.close()
+            # only recorded once fast-import has written everything up to it
+            if done is not None:
+                sp.check_call(['git', 'config', 'doublewrap.checkpoint', str(done)], cwd=dir_)
+
+    def _gitCheckpoint(self, dir_, files, target):
+        # the last backup time already in a previous gitrestore of the same files
+        def config(key):
+            try:
+                return sp.check_output(['git', 'config', '--get-all', 'doublewrap.' + key],
+                                       cwd=dir_).decode().strip()
+            except sp.CalledProcessError:
+                return None
+
+        if not os.path.isdir(os.path.join(dir_, '.git')) or config('file') is None:
+            raise RuntimeError('{} exists and is not empty. exiting'.format(dir_))
+        restored_files = config('file').split('\n')
+        if sorted(restored_files) != sorted(files) or config('target') != target:
+            raise RuntimeError('{} is a gitrestore of {} to {}'.format(dir_, ', '.join(restored_files),
+                                                                      config('target')))
+        # fast-import may have finished commits after the checkpoint was last recorded
+        times = [int(t) for t in [config('checkpoint')] if t is not None]
+        if sp.call(['git', 'rev-parse', '--verify', '-q', 'HEAD'], cwd=dir_, stdout=sp.PIPE) == 0:
+            times.append(int(sp.check_output(['git', 'log', '-1', '--format=%ct'], cwd=dir_).decode()))
+        if len(times) == 0:
+            return None
+        return max(times)
+
+    def _restoreVersions(self, file_, times, scratch_root, jobs=1):
+        # versions are restored concurrently but always yielded in timestamp order. at most jobs versions
+        # are restored ahead of the one being committed, so scratch space stays bounded. file_ may also be
+        # a list of paths, each is then restored to its place below the archive root where it exists
+        lock = threading.Lock()
+        running = set()
+        cancelled = []
+
+
+        def restoreOne(time_, copies):
+            restored = os.path.join(tempfile.mkdtemp(dir=scratch_root), 'restored')
+            if isinstance(file_, list):
+                restores = [(os.path.join(restored, f), f) for f in file_
+                            if len(self.manifestEntries(time_, f, recursive=False)) > 0]
+            else:
+                restores = [(restored, file_)]
+            with self._phase('restore_version', time=time_), copies.borrow() as archive_dir:
+                for target, path in restores:
+                    _makedirs(os.path.dirname(target))
+                    cmd = self._restoreCmd(target, path, time_, archive_dir)
+                    self._connect()
+                    with lock:
+                        if len(cancelled) > 0:
+                            raise RuntimeError('gitrestore was stopped')
+                        self.logger.info('Running command {}'.format(' '.join(cmd)))
+                        command = _Command(cmd, self.logger)
+                        running.add(command)
+                    try:
+                        self._runAndLogQuiet(command)
+                    finally:
+                        with lock:
+                            running.discard(command)
+            return time_, restored
+
+        with self._archiveCopies(jobs) as copies:
+            if jobs <= 1:
+                for time_ in times:
+                    yield restoreOne(time_, copies)
+                return
+            times = iter(times)
+            pending = collections.deque(_Async(restoreOne, (time_, copies))
+                                        for time_ in itertools.islice(times, jobs))
+            complete = False
+            try:
+                while len(pending) > 0:
+                    result = pending.popleft().get()
+                    for time_ in itertools.islice(times, 1):
+                        pending.append(_Async(restoreOne, (time_, copies)))
+                    yield result
+                complete = True
+            finally:
+                if not complete:
+                    # stop the restores still running before the caller removes their scratch space
+                    with lock:
+                        cancelled.append(True)
+                        for command in running:
+                            if command.p.poll() is None:
+                                command.p.terminate()
+                for restore in pending:
+                    restore.thread.join()
+
+    def _gitcfg(self, dir_):
+        sp.check_call(['git', 'config', 'user.name', 'autorecovery'], cwd=dir_)
+        sp.check_call(['git', 'config', 'user.email', 'autorecovery'], cwd=dir_)
+
+    def _gitinit(self, dir_):
+        sp.check_output(['git', 'init'], cwd=dir_)
+
+
+def _fleetConfigs(paths):
+    cfg_files = []
+    for path in paths:
+        path = os.path.expanduser(path)
+        if os.path.isdir(path):
+            cfg_files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.conf'))
+        else:
+            cfg_files.append(path)
+    return cfg_files
+
+
+def runFleet(paths, jobs=4, per_host=1, verbosity=0, backup_args=()):
+    # backs up every config, never running more than per_host jobs against the same destination
+    logger = logging.getLogger('doublewrap')
+    results = []
+    pending = []
+    for cfg_file in _fleetConfigs(paths):
+        try:
+            dw = DuplicityWrapper(cfg_file, verbosity=verbosity)
+        except Exception as e:
+            # missing files as well as unparsable values, e.g. jobs = many
+            results.append({'config': cfg_file, 'host': None, 'error': e, 'elapsed': 0.})
+            continue
+        pending.append((cfg_file, dw, (dw.host, dw.port)))
+
+    condition = threading.Condition()
+    running = collections.Counter()
+
+    def nextJob():
+        with condition:
+            while len(pending) > 0:
+                for i, (_, _, host) in enumerate(pending):
+                    if running[host] < per_host:
+                        running[host] += 1
+                        return pending.pop(i)
+                condition.wait()
+            return None
+
+    def worker():
+        job = nextJob()
+        while job is not None:
+            cfg_file, dw, host = job
+            start = time.time()
+            error = None
+            try:
+                with dw:
+                    dw.backup(*backup_args)
+            except Exception as e:
+                # whatever goes wrong is this config's failure, the other jobs keep going
+                error = e
+            finally:
+                elapsed = time.time() - start
+                with condition:
+                    results.append({'config': cfg_file, 'host': host[0], 'error': error, 'elapsed': elapsed})
+                    running[host] -= 1
+                    condition.notify_all()
+            if error is None:
+                logger.info('Backed up {} in {:.1f}s'.format(cfg_file, elapsed))
+            else:
+                logger.error('Backup of {} failed after {:.1f}s: {}'.format(cfg_file, elapsed, error))
+            job = nextJob()
+
+    workers = [threading.Thread(target=worker) for _ in range(max(1, min(jobs, len(pending))))]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Wrapper for duplicity')
+    parser.add_argument('-c', '--config_file', dest='config_file', type=str, default='~/.config/doublewrap.conf',
+                        help='Config file location')
+    parser.add_argument('-v', '--verbosity', dest='v', default=0, type=int,
+                        help='between 0 (no output) to 9 (full output)')
+    parser.add_argument('--offline', action='store_true',
+                        help='answer status, list and history from the local cache without contacting the remote')
+    subparsers = parser.add_subparsers()
+    backup_p = subparsers.add_parser('backup', help='Run backup')
+    backup_p.set_defaults(func=DuplicityWrapper.backup)
+    backup_p.set_defaults(action='backup')
+    list_p = subparsers.add_parser('list', help='List backed up files')
+    list_p.set_defaults(func=DuplicityWrapper.listfiles)
+    list_p.set_defaults(action='list')
+    list_p.add_argument('--prefix', dest='prefix', help='only list this path and what is below it')
+    list_p.add_argument('--pattern', dest='pattern', help='only list paths matching this glob')
+    restore_p = subparsers.add_parser('restore', help='Restore file(s)')
+    restore_p.set_defaults(func=DuplicityWrapper.restore)
+    restore_p.set_defaults(action='restore')
+    restore_p.add_argument('-f', '--file', dest='file_')
+    restore_p.add_argument('target')
+    verify_p = subparsers.add_parser('verify', help='')
+    verify_p.set_defaults(func=DuplicityWrapper.verify)
+    verify_p.set_defaults(action='verify')
+    verify_p.add_argument('-j', '--jobs', dest='jobs', type=int,
+                          help='verify every PATHS entry separately, this many at once')
+    verify_p.add_argument('--subtrees', action='store_true',
+                          help='verify every entry directly below a PATHS entry separately')
+    verify_p.add_argument('--sample', type=int,
+                          help='only verify this many random files of every PATHS entry')
+    status_p = subparsers.add_parser('status', help='')
+    status_p.set_defaults(func=DuplicityWrapper.status)
+    status_p.set_defaults(action='status')
+    status_p.add_argument('--json', dest='as_json', action='store_true', help='print backup chains as json')
+    history_p = subparsers.add_parser('history', help='show statistics of past backups')
+    history_p.set_defaults(func=DuplicityWrapper.backupHistory)
+    history_p.set_defaults(action='history')
+    gitrestore_p = subparsers.add_parser('gitrestore', help='restore all backed up versions to a git repository')
+    gitrestore_p.set_defaults(action='restoreGit')
+    gitrestore_p.set_defaults(func=DuplicityWrapper.restoreGit)
+    gitrestore_p.add_argument('file_to_restore', type=str)
+    gitrestore_p.add_argument('git_directory', type=str,
+                              help='new or empty directory, or a previous gitrestore of the same file to update')
+    gitrestore_p.add_argument('target', type=str, help='name of file restored file')
+    gitrestore_p.add_argument('-j', '--jobs', dest='jobs', default=1, type=int,
+                              help='number of versions to restore concurrently')
+    gitrestore_p.add_argument('-a', '--also', dest='also', action='append', default=[],
+                              help='another file or directory to commit along with file_to_restore, '
+                                   'target then is a directory')
+    fleet_p = subparsers.add_parser('fleet', help='back up many config files, ignores --config_file')
+    fleet_p.set_defaults(action='fleet')
+    fleet_p.add_argument('configs', nargs='+', help='config files or directories containing *.conf files')
+    fleet_p.add_argument('-j', '--jobs', dest='jobs', default=4, type=int,
+                         help='number of backups to run at once')
+    fleet_p.add_argument('--per-host', dest='per_host', default=1, type=int,
+                         help='number of backups to run at once against the same destination')
+    args = parser.parse_args()
+    if args.offline and getattr(args, 'action', None) not in ('status', 'list', 'history'):
+        parser.error('--offline only works with status, list and history')
+    # 0-1 -> 40
+    # 2-3 -> 30
+    # 4-8 -> 20
+    # 9 -> 10
+    v = args.v
+    if v <= 0:
+        loglevel = 40
+    elif v <= 3:
+        loglevel = int((3 - v) * 10. / 3. + 30)
+    elif v <= 8:
+        loglevel = int((8 - v) * 2 + 20)
+    elif v > 8:
+        loglevel = 10
+    logging.basicConfig(level=loglevel)
+    if args.action == 'fleet':
+        results = runFleet(args.configs, jobs=args.jobs, per_host=args.per_host, verbosity=v)
+        for result in results:
+            if result['error'] is None:
+                print('{}: ok ({:.1f}s)'.format(result['config'], result['elapsed']))
+            else:
+                print('{}: failed ({:.1f}s): {}'.format(result['config'], result['elapsed'], result['error']))
+        failed = len([r for r in results if r['error'] is not None])
+        print('{} of {} backups succeeded'.format(len(results) - failed, len(results)))
+        sys.exit(1 if failed > 0 else 0)
+    dw = DuplicityWrapper(args.config_file, verbosity=v)
+    dw.offline = args.offline
+    arglist = []
+    if args.action == 'restore':
+        arglist.append(args.target)
+        if 'file_' in args:
+            arglist.append(args.file_)
+    elif args.action == 'restoreGit':
+        arglist.append(args.git_directory)
+        if len(args.also) > 0:
+            arglist.append([args.file_to_restore] + args.also)
+        else:
+            arglist.append(args.file_to_restore)
+        arglist.append(args.target)
+        arglist.append(args.jobs)
+    elif args.action == 'list':
+        arglist.append(None)
+        arglist.append(args.prefix)
+        arglist.append(args.pattern)
+    elif args.action == 'status':
+        arglist.append(True)
+        arglist.append(args.as_json)
+    elif args.action == 'verify':
+        arglist.append(args.jobs)
+        arglist.append(args.subtrees)
+        arglist.append(args.sample)
+
+    with dw:
+        try:
+            out = args.func(dw, *arglist)
+            if isinstance(out, BackupStats):
+                out = [out]
+            if isinstance(out, dict):
+                for src in sorted(out):
+                    print('{}:'.format(src))
+                    for stats in (out[src] if isinstance(out[src], list) else [out[src]]):
+                        if stats is not None:
+                            print(stats.summary())
+            elif out is not None:
+                for l in out:
+                    print(l.summary() if isinstance(l, (BackupStats, VerifyChunk)) else l)
+        except RuntimeError as r:
+            for chunk in dw.verify_status:
+                print(chunk.summary())
+            print(r, file=sys.stderr)
+            sys.exit(1)
+        except sp.CalledProcessError as s:
+            print(s, file=sys.stderr)
+            sys.exit(1)
+
@@ -8,6 +8,8 @@ import doublewrap
 import filecmp
 import shutil
 import sys
+import time
+import json
 
 
 CFG_CONTENT = '''
@@ -135,6 +137,9 @@ class Testdoublewrap(unittest.TestCase):
     def setUp(self):
         self.dw = doublewrap.DuplicityWrapper(self.cfg_name, verbosity=9)
 
+    def tearDown(self):
+        self.dw.close()
+
     def test_0init(self):
         pass
 
@@ -190,6 +195,634 @@ class Testdoublewrap(unittest.TestCase):
             filecmp.clear_cache()
         self.assertTrue(filecmp.cmp(self.file2, os.path.join(restored_d1, 'test3'), shallow=False))
 
+    def test_9fileversions(self):
+        versions = self.dw.fileVersions(self.file1[1:])
+        self.assertEqual(len(versions), 2)
+        self.assertEqual(versions, self.dw.fileVersions(self.file1[1:]))
+
+    def test_9filechanges(self):
+        self.assertEqual(len(self.dw.fileChanges(self.file1[1:])), 2)
+        self.assertEqual(len(self.dw.fileChanges(self.dir1[1:])), 1)
+
+    def test_9gitrestorejobs(self):
+        gitrestored = os.path.join(self.tempdir, 'dir3_gitrestored')
+        restored_f1 = os.path.join(gitrestored, 'file1_restored')
+        self.dw.restoreGit(dir_=gitrestored, file_=self.file1[1:], target=restored_f1, jobs=2)
+        self.assertEqual(self.dw.restore_counts, {'restored': 2, 'skipped': 0})
+        if sys.version_info.major > 3.:
+            filecmp.clear_cache()
+        self.assertTrue(filecmp.cmp(self.file1, restored_f1, shallow=False))
+        with open(os.devnull, 'a') as null:
+            subprocess.check_call(['git', 'checkout', 'master^'], stdout=null, stderr=null, cwd=gitrestored)
+        self.assertTrue(filecmp.cmp(self.file1_copy, restored_f1, shallow=False))
+
+    def test_9gitrestoremany(self):
+        gitrestored = os.path.join(self.tempdir, 'dir5_gitrestored')
+        self.dw.restoreGit(dir_=gitrestored, file_=[self.file1[1:], self.file2[1:]], target='restored')
+        if sys.version_info.major > 3.:
+            filecmp.clear_cache()
+        restored = os.path.join(gitrestored, 'restored')
+        self.assertTrue(filecmp.cmp(self.file1, os.path.join(restored, 'test1'), shallow=False))
+        self.assertTrue(filecmp.cmp(self.file2, os.path.join(restored, 'test2', 'test3'), shallow=False))
+        log = subprocess.check_output(['git', 'log', '--format=%ct'], cwd=gitrestored).decode().split()
+        self.assertEqual(len(log), 2)
+
+    def test_9verifychunks(self):
+        self.assertEqual(len(self.dw.verify(jobs=2)), 2)
+        chunks = self.dw.verify(sample=1)
+        self.assertEqual(sorted(c.paths for c in chunks), sorted([[self.file1], [self.file2]]))
+
+    def test_9gitrestoreresume(self):
+        gitrestored = os.path.join(self.tempdir, 'dir4_gitrestored')
+        restored_f1 = os.path.join(gitrestored, 'file1_restored')
+        self.dw.restoreGit(dir_=gitrestored, file_=self.file1[1:], target=restored_f1)
+        # nothing new has been backed up since
+        self.dw.restoreGit(dir_=gitrestored, file_=self.file1[1:], target=restored_f1)
+        self.assertEqual(self.dw.restore_counts['restored'], 0)
+        log = subprocess.check_output(['git', 'log', '--format=%ct'], cwd=gitrestored).decode().split()
+        self.assertEqual(len(log), 2)
+
+
+OFFLINE_CFG_CONTENT = '''
+[PATHS]
+{}
+[DESTINATION]
+Host = localhost
+[AUTH]
+keyid = 33EA05F1
+[CACHE]
+dir = {}
+'''
+
+
+STATUS_OUTPUT = '''Last full backup date: Tue Jun 17 10:00:00 2014
+Collection Status
+-----------------
+Found 1 secondary backup chain.
+Secondary chain 1 of 1:
+-------------------------
+Chain start time: Mon Jun  2 10:00:00 2014
+Chain end time: Mon Jun  2 10:00:00 2014
+Number of contained backup sets: 1
+Total number of contained volumes: 1
+ Type of backup set:                            Time:      Num volumes:
+                Full         Mon Jun  2 10:00:00 2014                 1
+-------------------------
+
+Found primary backup chain with matching signature chain:
+-------------------------
+Chain start time: Tue Jun 17 10:00:00 2014
+Chain end time: Wed Jun 18 10:00:00 2014
+Number of contained backup sets: 2
+Total number of contained volumes: 3
+ Type of backup set:                            Time:      Num volumes:
+                Full         Tue Jun 17 10:00:00 2014                 2
+         Incremental         Wed Jun 18 10:00:00 2014                 1
+-------------------------
+No orphaned or incomplete backup sets found.
+'''
+
+
+BACKUP_OUTPUT = '''Local and Remote metadata are synchronized, no sync needed.
+--------------[ Backup Statistics ]--------------
+StartTime 1402999200.00 (Tue Jun 17 10:00:00 2014)
+EndTime 1402999202.50 (Tue Jun 17 10:00:02 2014)
+ElapsedTime 2.50 (2.50 seconds)
+SourceFiles 3
+SourceFileSize 4096 (4.00 KB)
+NewFiles 1
+ChangedFiles 2
+DeltaEntries 3
+Errors 0
+-------------------------------------------------
+'''
+
+
+class TestOffline(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cfg_name = os.path.join(self.tempdir, 'test.cfg')
+        with open(self.cfg_name, 'w') as cfg:
+            cfg.write(OFFLINE_CFG_CONTENT.format(self.tempdir, os.path.join(self.tempdir, 'cache')))
+        self.dw = doublewrap.DuplicityWrapper(self.cfg_name)
+
+    def tearDown(self):
+        self.dw.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_close(self):
+        control_dir = self.dw.control_dir
+        self.assertFalse(os.path.exists(control_dir))
+        self.dw._connect()
+        self.assertTrue(os.path.isdir(control_dir))
+        with self.dw:
+            pass
+        self.assertFalse(os.path.exists(control_dir))
+        self.dw.close()
+
+    def test_lazyinit(self):
+        cfg_content = OFFLINE_CFG_CONTENT.replace('Host = localhost', 'Host = doublewrap.invalid\nbackup_root = backups')
+        with open(self.cfg_name, 'w') as cfg:
+            cfg.write(cfg_content.format(self.tempdir, os.path.join(self.tempdir, 'cache')))
+        with doublewrap.DuplicityWrapper(self.cfg_name) as dw:
+            self.assertIsNone(dw.remote_listing)
+
+    def test_pathwrappers(self):
+        self.dw.split_paths = True
+        wrappers = self.dw.pathWrappers()
+        self.assertEqual(len(wrappers), 1)
+        self.assertEqual(wrappers[0].srcs, [self.tempdir])
+        self.assertNotEqual(wrappers[0].deststr, self.dw.deststr)
+        self.assertIsNone(wrappers[0].control_dir)
+        self.assertEqual(self.dw._wrapperFor(os.path.join(self.tempdir, 'a')[1:]).deststr, wrappers[0].deststr)
+        self.assertRaises(RuntimeError, self.dw._wrapperFor, 'elsewhere/a')
+
+    def test_splitchains(self):
+        self.dw.split_paths = True
+        self.dw.srcs = [os.path.join(self.tempdir, 'a'), os.path.join(self.tempdir, 'b')]
+        self.dw.offline = True
+        for wrapper in self.dw.pathWrappers():
+            path = os.path.join(wrapper.cache_dir, 'runs', 'status')
+            doublewrap._makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(STATUS_OUTPUT)
+            wrapper._setLatest(wrapper._statusCmd(), path)
+        chains = self.dw.backupChains()
+        self.assertEqual(sorted(chains), self.dw.srcs)
+        self.assertEqual([(c.chain, len(c.sets)) for c in chains[self.dw.srcs[0]]],
+                         [('secondary 1', 1), ('primary', 2)])
+        status = json.loads(self.dw.status(display=False, as_json=True))
+        self.assertEqual(len(status[self.dw.srcs[1]]), 2)
+
+    def test_fleetconfigs(self):
+        self.assertEqual(doublewrap._fleetConfigs([self.tempdir]), [])
+        os.rename(self.cfg_name, os.path.join(self.tempdir, 'test.conf'))
+        self.assertEqual(doublewrap._fleetConfigs([self.tempdir, 'other.cfg']),
+                         [os.path.join(self.tempdir, 'test.conf'), 'other.cfg'])
+
+    def test_fleetmissingconfig(self):
+        results = doublewrap.runFleet([os.path.join(self.tempdir, 'missing.conf')])
+        self.assertEqual(len(results), 1)
+        self.assertIsInstance(results[0]['error'], RuntimeError)
+
+    def test_fleetbackuperror(self):
+        # an unexpected exception must not leave the host busy for the next config
+        cfg_files = []
+        for name in ['a.conf', 'b.conf']:
+            cfg_files.append(os.path.join(self.tempdir, name))
+            shutil.copy(self.cfg_name, cfg_files[-1])
+
+        def backup(dw, *args):
+            raise ValueError('unexpected')
+        original = doublewrap.DuplicityWrapper.backup
+        doublewrap.DuplicityWrapper.backup = backup
+        try:
+            results = doublewrap.runFleet(cfg_files, jobs=2)
+        finally:
+            doublewrap.DuplicityWrapper.backup = original
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(isinstance(r['error'], ValueError) for r in results))
+
+    def test_fleetperhost(self):
+        # a different User on the same Host still counts against the same host
+        cfg_files = []
+        for user in ['alice', 'bob']:
+            cfg_files.append(os.path.join(self.tempdir, user + '.conf'))
+            with open(cfg_files[-1], 'w') as cfg:
+                cfg.write(OFFLINE_CFG_CONTENT.format(self.tempdir, os.path.join(self.tempdir, 'cache')).replace(
+                    'Host = localhost', 'Host = localhost\nUser = ' + user))
+        active = []
+        overlaps = []
+
+        def backup(dw, *args):
+            active.append(dw.ssh_target)
+            overlaps.append(len(active))
+            time.sleep(0.1)
+            active.remove(dw.ssh_target)
+        original = doublewrap.DuplicityWrapper.backup
+        doublewrap.DuplicityWrapper.backup = backup
+        try:
+            results = doublewrap.runFleet(cfg_files, jobs=2, per_host=1)
+        finally:
+            doublewrap.DuplicityWrapper.backup = original
+        self.assertEqual([r['error'] for r in results], [None, None])
+        self.assertEqual(overlaps, [1, 1])
+
+    def test_fleetbadconfig(self):
+        bad = os.path.join(self.tempdir, 'bad.conf')
+        with open(bad, 'w') as cfg:
+            cfg.write(OFFLINE_CFG_CONTENT.format(self.tempdir, os.path.join(self.tempdir, 'cache')).replace(
+                'Host = localhost', 'Host = localhost\njobs = many'))
+        controls = set(os.listdir(tempfile.gettempdir()))
+        results = doublewrap.runFleet([bad, os.path.join(self.tempdir, 'missing.conf')])
+        self.assertEqual(len(results), 2)
+        self.assertIsInstance(results[0]['error'], ValueError)
+        self.assertEqual(set(os.listdir(tempfile.gettempdir())), controls)
+
+    def test_parselistline(self):
+        self.assertEqual(doublewrap._parseListLine('Wed Jun 18 10:00:00 2014 home/a file'),
+                         (doublewrap._parseTime('Wed Jun 18 10:00:00 2014'), 'home/a file'))
+        self.assertIsNone(doublewrap._parseListLine('Last full backup date: Wed Jun 18 10:00:00 2014'))
+        self.assertIsNone(doublewrap._parseListLine(''))
+
+    def test_parsestatus(self):
+        chains = doublewrap._groupChains(doublewrap._parseStatus(STATUS_OUTPUT.split('\n')))
+        self.assertEqual([c.chain for c in chains], ['secondary 1', 'primary'])
+        self.assertEqual([s.type for s in chains[1].sets], ['Full', 'Incremental'])
+        self.assertEqual([s.volumes for s in chains[1].sets], [2, 1])
+        self.assertEqual(chains[1].start, doublewrap._parseTime('Tue Jun 17 10:00:00 2014'))
+        self.assertEqual(chains[1].end, doublewrap._parseTime('Wed Jun 18 10:00:00 2014'))
+        self.assertEqual(doublewrap._chainsToDict(chains)[0]['sets'][0]['volumes'], 1)
+
+    def test_rotationpolicy(self):
+        chains = doublewrap._groupChains(doublewrap._parseStatus(STATUS_OUTPUT.split('\n')))
+        start = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(chains[1].start))
+        end = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(chains[1].end))
+        self.dw._setRemoteListing('''total 12
+drwxr-xr-x 2 user user 4096 Jun 18 10:00 .
+-rw-r--r-- 1 user user 1000 Jun 17 10:00 duplicity-full.{0}.vol1.difftar.gpg
+-rw-r--r-- 1 user user   10 Jun 17 10:00 duplicity-full-signatures.{0}.sigtar.gpg
+-rw-r--r-- 1 user user  600 Jun 18 10:00 duplicity-inc.{0}.to.{1}.vol1.difftar.gpg
+'''.format(start, end))
+        remote_ls = self.dw.remote_listing
+        self.assertTrue(self.dw._needsFull([], chains))
+        self.assertFalse(self.dw._needsFull(remote_ls, chains))
+        self.assertEqual(self.dw._chainSizes(chains[1].start), (1000, 600))
+        self.dw.policy = {'max_incremental_ratio': 0.5}
+        self.assertTrue(self.dw._needsFull(remote_ls, chains))
+        self.dw.policy = {'max_incrementals': 2}
+        self.assertFalse(self.dw._needsFull(remote_ls, chains))
+        self.dw.policy = {'max_incrementals': 1}
+        self.assertTrue(self.dw._needsFull(remote_ls, chains))
+        self.dw.policy = {'max_age': 30}
+        self.assertTrue(self.dw._needsFull(remote_ls, chains))
+
+    def test_manifest(self):
+        entries = {'home/a file': 1, 'home/b': 2}
+        self.dw._writeManifest(self.dw._manifestPath(10), entries)
+        self.assertEqual(self.dw.manifest(10), entries)
+
+    def test_manifestentries(self):
+        entries = dict(('dir{}/file {}'.format(i % 7, i), i) for i in range(500))
+        entries.update({'dir1': 1000, 'dir1.txt': 1001, 'dir10': 1002})
+        self.dw._writeManifest(self.dw._manifestPath(10), entries)
+        below = self.dw.manifestEntries(10, 'dir1')
+        self.assertEqual(below[0], ('dir1', 1000))
+        self.assertEqual(sorted(below[1:]), sorted((k, v) for k, v in entries.items() if k.startswith('dir1/')))
+        self.assertEqual(self.dw.manifestEntries(10, 'dir3/file 10', recursive=False), [('dir3/file 10', 10)])
+        self.assertEqual(self.dw.manifestEntries(10, 'dir3/file 1000'), [])
+        self.assertEqual(self.dw.manifestEntries(10, 'zzz'), [])
+        self.assertEqual(self.dw.manifestEntries(10, 'a'), [])
+
+    def test_listfilesmanifest(self):
+        mtime = doublewrap._parseTime('Mon Jun  2 10:00:00 2014')
+        self.dw._writeManifest(self.dw._manifestPath(10), {'.': mtime, 'a': mtime, 'a/b.txt': mtime, 'c.txt': mtime})
+        # answered from the manifest, the remote is never contacted
+        self.dw.offline = True
+        self.assertEqual(list(self.dw.listfiles(10, prefix='a')),
+                         ['Mon Jun  2 10:00:00 2014 a', 'Mon Jun  2 10:00:00 2014 a/b.txt'])
+        self.assertEqual([l.split()[-1] for l in self.dw.listfiles(10, pattern='*.txt')], ['a/b.txt', 'c.txt'])
+        with self.assertRaises(RuntimeError):
+            list(self.dw.listfiles(11, prefix='a'))
+
+    def test_verifychunks(self):
+        self.dw.srcs = ['/data']
+        self.dw._getTimes = lambda: iter([10])
+        self.dw._writeManifest(self.dw._manifestPath(10), {'data': 1, 'data/a': 2, 'data/a/x': 3, 'data/b': 4,
+                                                           'other': 5})
+        self.assertEqual(self.dw._chunkPaths(False, None), [['/data']])
+        self.assertEqual(self.dw._chunkPaths(True, None), [['/data/a'], ['/data/b']])
+        self.assertEqual(self.dw._chunkPaths(False, 5), [['/data/a/x', '/data/b']])
+        self.assertEqual(len(self.dw._chunkPaths(False, 1)[0]), 1)
+        self.assertEqual(self.dw._verifyCmd(['/data/a', '/data/b'], 'list')[-6:],
+                         ['--include-filelist', 'list', '--exclude', '/', self.dw.deststr, '/'])
+        verify_cmd = self.dw._verifyCmd(['/data/a'], None, 'copy')
+        self.assertEqual(verify_cmd[verify_cmd.index('--archive-dir') + 1], 'copy')
+        # concurrent chunks each get their own archive dir, removed afterwards
+        self.dw.archive_root = os.path.join(self.tempdir, 'duplicity')
+        archive_dirs = []
+
+        def failingCmd(paths, filelist, archive_dir):
+            archive_dirs.append(archive_dir)
+            return [sys.executable, '-c', 'import sys; sys.exit("/data/b" in sys.argv)'] + paths
+        self.dw._verifyCmd = failingCmd
+        with self.assertRaises(RuntimeError):
+            self.dw.verify(jobs=2, subtrees=True)
+        self.assertEqual([(c.paths, c.error is None) for c in self.dw.verify_status],
+                         [(['/data/a'], True), (['/data/b'], False)])
+        self.assertNotIn(None, archive_dirs)
+        self.assertEqual(os.listdir(self.dw.archive_root), [])
+        # samples are handed over in a file that is removed afterwards
+        filelists = []
+
+        def verifyCmd(paths, filelist, archive_dir):
+            self.assertIsNone(archive_dir)
+            with open(filelist) as f:
+                filelists.append((filelist, f.read().split('\n')))
+            return [sys.executable, '-c', 'pass']
+        self.dw._verifyCmd = verifyCmd
+        self.dw.verify(sample=5)
+        self.assertEqual(filelists[0][1], ['/data/a/x', '/data/b', ''])
+        self.assertFalse(os.path.exists(filelists[0][0]))
+
+    def test_filterlisting(self):
+        date = 'Wed Jun 18 10:00:00 2014 '
+        lines = ['Last full backup date: none'] + [date + p for p in ['.', 'a', 'a/b', 'a/b/c.txt', 'a/b/d', 'a/c', 'b']]
+        self.assertEqual(list(doublewrap._filterListing(iter(lines), prefix='a/b')),
+                         [date + p for p in ['a/b', 'a/b/c.txt', 'a/b/d']])
+        self.assertEqual(list(doublewrap._filterListing(iter(lines), pattern='*.txt')), [date + 'a/b/c.txt'])
+        # names sorting before the root entry '.'
+        symbols = [date + p for p in ['.', '#x', '-notes', '-notes/a', 'b']]
+        self.assertEqual(list(doublewrap._filterListing(iter(symbols), prefix='-notes')),
+                         [date + '-notes', date + '-notes/a'])
+
+        def stopsearly():
+            for l in lines[:-1]:
+                yield l
+            raise AssertionError('read past prefix')
+        self.assertEqual(len(list(doublewrap._filterListing(stopsearly(), prefix='a/b'))), 3)
+
+    def test_remotefingerprint(self):
+        listing = '''total 8
+drwxr-xr-x 2 user user 4096 Jun 18 10:00 .
+drwxr-xr-x 9 user user 4096 Jun 18 10:00 ..
+-rw-r--r-- 1 user user  100 Jun 18 10:00 duplicity-full-signatures.20140618T100000Z.sigtar.gpg
+'''
+        remote = os.path.join(self.tempdir, 'remote')
+        with open(remote, 'w') as f:
+            f.write(listing)
+        self.dw._probeCmd = lambda: [sys.executable, '-c', 'import sys; sys.stdout.write(open(sys.argv[1]).read())',
+                                     remote]
+        fingerprint = self.dw.remoteFingerprint()
+        with open(remote, 'w') as f:
+            f.write(listing.replace('4096 Jun 18 10:00 ..', '4096 Jun 19 11:00 ..'))
+        self.assertEqual(self.dw.remoteFingerprint(), fingerprint)
+        # another host wrote to the archive, this instance notices without a backup of its own
+        with open(remote, 'w') as f:
+            f.write(listing.replace(' 100 ', ' 200 '))
+        self.assertNotEqual(self.dw.remoteFingerprint(), fingerprint)
+
+    def test_runandcache(self):
+        path = os.path.join(self.dw.cache_dir, 'runs', 'echo')
+        cmd = [sys.executable, '-c', 'print("a b")']
+        self.assertEqual(list(self.dw._runAndCache(path, cmd)), ['a b'])
+        self.assertEqual(list(self.dw._readCached(path)), ['a b'])
+        cmd = [sys.executable, '-c', 'import sys; sys.exit(1)']
+        with self.assertRaises(subprocess.CalledProcessError):
+            list(self.dw._runAndCache(path + '2', cmd))
+        self.assertFalse(os.path.exists(path + '2'))
+
+    def test_offline(self):
+        self.dw.offline = True
+        with self.assertRaises(RuntimeError):
+            self.dw.status(display=False)
+        cmd = self.dw._statusCmd()
+        path = os.path.join(self.dw.cache_dir, 'runs', 'status')
+        doublewrap._makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(STATUS_OUTPUT)
+        self.dw._setLatest(cmd, path)
+        self.assertEqual(self.dw.status(display=False), STATUS_OUTPUT.split('\n')[:-1])
+        self.assertEqual(len(self.dw.backupChains()), 2)
+
+    def test_fastimport(self):
+        repo = os.path.join(self.tempdir, 'repo')
+        os.mkdir(repo)
+        self.dw._gitinit(repo)
+        version = os.path.join(self.tempdir, 'version')
+        os.mkdir(version)
+        with open(os.path.join(version, 'a file'), 'w') as f:
+            f.write('one')
+        writer = doublewrap._FastImportWriter(repo, 'restored', self.dw.logger)
+        self.assertTrue(writer.commit(1000000000, version))
+        self.assertFalse(writer.commit(1000000001, version))
+        with open(os.path.join(version, 'a file'), 'w') as f:
+            f.write('two')
+        self.assertTrue(writer.commit(1000000002, version))
+        writer.close()
+        log = subprocess.check_output(['git', 'log', '--format=%ct'], cwd=repo).decode().split()
+        self.assertEqual(log, ['1000000002', '1000000000'])
+        with open(os.path.join(repo, 'restored', 'a file')) as f:
+            self.assertEqual(f.read(), 'two')
+
+    def test_fastimportresume(self):
+        repo = os.path.join(self.tempdir, 'repo')
+        os.mkdir(repo)
+        self.dw._gitinit(repo)
+        version = os.path.join(self.tempdir, 'version')
+        with open(version, 'w') as f:
+            f.write('one')
+        writer = doublewrap._FastImportWriter(repo, 'restored', self.dw.logger)
+        writer.commit(1000000000, version)
+        writer.close()
+        # a second run continues the branch and knows what is already committed
+        writer = doublewrap._FastImportWriter(repo, 'restored', self.dw.logger)
+        self.assertFalse(writer.commit(1000000001, version))
+        with open(version, 'w') as f:
+            f.write('two')
+        self.assertTrue(writer.commit(1000000002, version))
+        writer.close()
+        log = subprocess.check_output(['git', 'log', '--format=%ct'], cwd=repo).decode().split()
+        self.assertEqual(log, ['1000000002', '1000000000'])
+
+    def test_gitcheckpoint(self):
+        repo = os.path.join(self.tempdir, 'repo')
+        os.mkdir(repo)
+        with open(os.path.join(repo, 'other'), 'w') as f:
+            f.write('other')
+        with self.assertRaises(RuntimeError):
+            self.dw._gitCheckpoint(repo, 'a', 'b')
+        self.dw._gitinit(repo)
+        subprocess.check_call(['git', 'config', 'doublewrap.file', 'a'], cwd=repo)
+        subprocess.check_call(['git', 'config', 'doublewrap.target', 'b'], cwd=repo)
+        self.assertIsNone(self.dw._gitCheckpoint(repo, 'a', 'b'))
+        with self.assertRaises(RuntimeError):
+            self.dw._gitCheckpoint(repo, 'c', 'b')
+        subprocess.check_call(['git', 'config', 'doublewrap.checkpoint', '1000000005'], cwd=repo)
+        self.assertEqual(self.dw._gitCheckpoint(repo, 'a', 'b'), 1000000005)
+
+    def test_fastimportpaths(self):
+        self.assertEqual(doublewrap._commonParent(['home/a/x', 'home/a/y/z']), 'home/a')
+        self.assertEqual(doublewrap._commonParent(['home/a', 'etc/b']), '')
+        repo = os.path.join(self.tempdir, 'repo')
+        os.mkdir(repo)
+        self.dw._gitinit(repo)
+        version = os.path.join(self.tempdir, 'version')
+        os.makedirs(os.path.join(version, 'sub'))
+        for name in ['x', 'unrelated', os.path.join('sub', 'y')]:
+            with open(os.path.join(version, name), 'w') as f:
+                f.write(name)
+        writer = doublewrap._FastImportWriter(repo, 'restored', self.dw.logger, ['x', 'sub', 'missing'])
+        self.assertTrue(writer.commit(1000000000, version))
+        writer.close()
+        files = subprocess.check_output(['git', 'ls-files'], cwd=repo).decode().split()
+        self.assertEqual(files, ['restored/sub/y', 'restored/x'])
+
+    def test_gitrestoredisjoint(self):
+        self.dw._getTimes = lambda: iter([10, 20])
+        self.dw._writeManifest(self.dw._manifestPath(10), {'etc': 1, 'etc/x': 1, 'home': 1, 'home/y': 1})
+        self.dw._writeManifest(self.dw._manifestPath(20), {'etc': 1, 'etc/x': 2})
+        restores = []
+
+        def restoreCmd(target, file_, time_, archive_dir):
+            restores.append((file_, time_))
+            return [sys.executable, '-c', 'import sys; open(sys.argv[1], "w").write(sys.argv[2])', target,
+                    '{}@{}'.format(file_, time_)]
+        self.dw._restoreCmd = restoreCmd
+        repo = os.path.join(self.tempdir, 'repo')
+        self.dw.restoreGit(repo, ['etc/x', 'home/y'], 'restored')
+        # one restore per top level directory that exists in the snapshot, never the whole archive
+        self.assertEqual(restores, [('etc/x', 10), ('home/y', 10), ('etc/x', 20)])
+        files = subprocess.check_output(['git', 'ls-tree', '-r', '--name-only', 'HEAD^'], cwd=repo).decode().split()
+        self.assertEqual(files, ['restored/etc/x', 'restored/home/y'])
+        files = subprocess.check_output(['git', 'ls-files'], cwd=repo).decode().split()
+        self.assertEqual(files, ['restored/etc/x'])
+
+    def test_restoreversions(self):
+        scratch = os.path.join(self.tempdir, 'scratch')
+        os.mkdir(scratch)
+        self.dw.archive_root = os.path.join(self.tempdir, 'duplicity')
+        started = []
+        archive_dirs = []
+
+        def restoreCmd(target, file_, time_, archive_dir):
+            started.append(time_)
+            archive_dirs.append(archive_dir)
+            if time_ == 1:
+                return [sys.executable, '-c', 'import sys; sys.exit(1)']
+            if time_ == 2:
+                return [sys.executable, '-c', 'import time; time.sleep(60)']
+            return [sys.executable, '-c', 'pass']
+        self.dw._restoreCmd = restoreCmd
+        # only about jobs versions are restored ahead of the consumer
+        versions = self.dw._restoreVersions('a', [3, 4, 5, 6, 7, 8], scratch, jobs=2)
+        self.assertEqual(next(versions)[0], 3)
+        self.assertLessEqual(len(started), 3)
+        versions.close()
+        # concurrent restores never share duplicity's archive dir, the copies are gone afterwards
+        self.assertEqual(len(set(archive_dirs[:2])), 2)
+        self.assertNotIn(None, archive_dirs)
+        self.assertEqual(os.listdir(self.dw.archive_root), [])
+        # a failure stops the restores still running instead of leaving them behind
+        start = time.time()
+        with self.assertRaises(subprocess.CalledProcessError):
+            list(self.dw._restoreVersions('a', [1, 2], scratch, jobs=2))
+        self.assertLess(time.time() - start, 30)
+
+    def test_archivecopies(self):
+        shared = os.path.join(self.tempdir, 'duplicity', 'abc')
+        os.makedirs(shared)
+        for name in ['duplicity-full.20140617T100000Z.manifest', 'lockfile']:
+            with open(os.path.join(shared, name), 'w') as f:
+                f.write(name)
+        with doublewrap._ArchiveCopies(shared, 1) as copies:
+            with copies.borrow() as archive_dir:
+                self.assertIsNone(archive_dir)
+        with doublewrap._ArchiveCopies(shared, 2) as copies:
+            with copies.borrow() as first:
+                with copies.borrow() as second:
+                    self.assertNotEqual(first, second)
+            for archive_dir in [first, second]:
+                # seeded with the metadata, but not with the lock of the shared one
+                self.assertEqual(os.listdir(os.path.join(archive_dir, 'abc')),
+                                 ['duplicity-full.20140617T100000Z.manifest'])
+        self.assertEqual(os.listdir(os.path.dirname(shared)), ['abc'])
+
+    def test_runandlogstderr(self):
+        # more stderr than a pipe buffer holds, written before any stdout
+        cmd = [sys.executable, '-c', 'import sys; sys.stderr.write("e\\n" * 100000); print("done"); sys.exit(2)']
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            list(self.dw.runAndLog(cmd, yieldoutput=True))
+        self.assertEqual(len(cm.exception.output.split('\n')), doublewrap._Command.stderr_tail_lines)
+        self.assertEqual(self.dw.command_timings[-1][0], cmd)
+
+    def test_runandlogabandoned(self):
+        cmd = [sys.executable, '-c', 'while True: print("line")']
+        lines = self.dw.runAndLog(cmd, yieldoutput=True)
+        self.assertEqual(next(lines), 'line')
+        lines.close()
+        self.assertEqual(len(self.dw.command_timings), 1)
+
+    def test_parsebackupstats(self):
+        stats = doublewrap._parseBackupStats(BACKUP_OUTPUT.split('\n'))
+        self.assertEqual(stats['ElapsedTime'], 2.5)
+        self.assertEqual(stats['SourceFileSize'], 4096)
+        self.assertEqual(stats['ChangedFiles'], 2)
+        self.assertNotIn('Local', stats)
+
+    def test_metrics(self):
+        events = []
+        self.dw.addMetricsCallback(lambda event, data: events.append((event, data)))
+        prom = os.path.join(self.tempdir, 'doublewrap.prom')
+        self.dw.addMetricsCallback(doublewrap.PrometheusMetrics.forPath(prom))
+        self.assertIs(doublewrap.PrometheusMetrics.forPath(prom), self.dw.metrics_callbacks[-1])
+        self.dw.runAndLog([sys.executable, '-c', 'pass'])
+        self.dw.history_root = os.path.join(self.tempdir, 'history')
+        self.dw.split_paths = True
+        self.dw.srcs = ['/a', '/b']
+        for wrapper in self.dw.pathWrappers():
+            wrapper._recordBackup('full', {'SourceFiles': 3.})
+        self.assertEqual(events[0][0], 'command')
+        self.assertEqual(events[0][1]['exit_code'], 0)
+        self.assertEqual(events[-1][1]['source'], '/b')
+        with open(prom) as f:
+            content = f.read()
+        self.assertIn('doublewrap_commands_total{{action="{}",exit_code="0"}} 1'.format(
+            os.path.basename(sys.executable)), content)
+        for wrapper in self.dw.pathWrappers():
+            self.assertIn('doublewrap_backup_source_files{{dest="{}",source="{}"}} 3.0'.format(
+                wrapper.deststr, wrapper.srcs[0]), content)
+
+    def test_backuphistory(self):
+        self.dw.history_path = os.path.join(self.tempdir, 'history', 'history.jsonl')
+        self.dw.history_size = 2
+        stats = doublewrap._parseBackupStats(BACKUP_OUTPUT.split('\n'))
+        for i in range(3):
+            backup_stats = self.dw._recordBackup('incr', stats)
+        self.assertEqual(backup_stats.type, 'incr')
+        self.assertEqual(backup_stats.changed_files, 2)
+        self.assertAlmostEqual(backup_stats.throughput, 4096 / 2. ** 20 / 2.5)
+        self.assertAlmostEqual(backup_stats.change_rate, 1.)
+        history = self.dw.backupHistory()
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history[-1], backup_stats)
+
+    def test_throttle(self):
+        self.dw.history_path = os.path.join(self.tempdir, 'history.jsonl')
+        self.dw.throttle = {'bwlimit': 512, 'nice': 10, 'ionice_class': 3, 'volsize': 'auto',
+                            'asynchronous_upload': 'auto'}
+        backup_cmd = self.dw._backupCmd(False, [])
+        self.assertEqual(backup_cmd[:7], ['nice', '-n', '10', 'ionice', '-c', '3', 'duplicity'])
+        self.assertIn('--rsync-options=--bwlimit=512', backup_cmd)
+        self.assertNotIn('--rsync-options', backup_cmd)
+        # no history yet, nothing to derive the volume size from
+        self.assertNotIn('--volsize', backup_cmd)
+        self.assertEqual(doublewrap._commandAction(backup_cmd), 'full')
+        stats = doublewrap._parseBackupStats(BACKUP_OUTPUT.split('\n'))
+        stats.update({'TotalDestinationSizeChange': 100 * 2 ** 20, 'SourceFileSize': 2 * 2 ** 30})
+        self.dw._recordBackup('full', stats)
+        backup_cmd = self.dw._backupCmd(True, [])
+        # limited to 512 KB/s by bwlimit, about a minute of upload per volume
+        self.assertEqual(backup_cmd[backup_cmd.index('--volsize') + 1], '30')
+        self.assertIn('--asynchronous-upload', backup_cmd)
+        hour = time.localtime().tm_hour
+        self.dw.throttle = {'nice': 10, 'hours': [(hour + 1) % 24, (hour + 2) % 24]}
+        self.assertEqual(self.dw._backupCmd(True, [])[0], 'duplicity')
+
+    def test_evictcache(self):
+        self.dw.cache_max_size = 0
+        self.dw._writeManifest(self.dw._manifestPath(10), {'a': 1})
+        self.dw._evictCache()
+        self.assertFalse(os.path.exists(self.dw._manifestPath(10)))
+        # the entry just written survives, as do files other writers are still filling
+        self.dw._writeManifest(self.dw._manifestPath(11), {'a': 1})
+        with open(self.dw._manifestPath(12) + '.tmp', 'w') as f:
+            f.write('partial')
+        self.dw._evictCache(keep=self.dw._manifestPath(11))
+        self.assertEqual(self.dw.manifestEntries(11, 'a'), [('a', 1)])
+        self.assertTrue(os.path.exists(self.dw._manifestPath(12) + '.tmp'))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import doublewrap_async
+
+
+CFG_CONTENT = '''
+[PATHS]
+{}
+[DESTINATION]
+Host = localhost
+[AUTH]
+keyid = 33EA05F1
+[CACHE]
+dir = {}
+'''
+
+
+class TestAsync(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        cfg_name = os.path.join(self.tempdir, 'test.cfg')
+        with open(cfg_name, 'w') as cfg:
+            cfg.write(CFG_CONTENT.format(self.tempdir, os.path.join(self.tempdir, 'cache')))
+        self.dw = doublewrap_async.AsyncDuplicityWrapper(cfg_name)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.dw.close())
+        self.loop.close()
+        shutil.rmtree(self.tempdir)
+
+    def collect(self, cmd):
+        async def run():
+            return [l async for l in self.dw.runAndLog(cmd)]
+        return self.loop.run_until_complete(run())
+
+    def test_runandlog(self):
+        cmd = [sys.executable, '-c', 'import sys; sys.stderr.write("e\\n" * 100000); print("a"); print("b")']
+        self.assertEqual(self.collect(cmd), ['a', 'b'])
+        self.assertEqual(self.dw.wrapper.command_timings[-1][0], cmd)
+
+    def test_runandlogerror(self):
+        cmd = [sys.executable, '-c', 'import sys; sys.stderr.write("failed"); sys.exit(3)']
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            self.collect(cmd)
+        self.assertEqual(cm.exception.output, 'failed')
+
+    def test_timeout(self):
+        cmd = [sys.executable, '-c', 'import time; time.sleep(60)']
+        with self.assertRaises(asyncio.TimeoutError):
+            self.loop.run_until_complete(self.dw._run(cmd, timeout=0.5))
+        self.assertEqual(len(self.dw.wrapper.command_timings), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()